@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for BUMA
+
+Wall time & peak memory of the dynamic stock model & the stages of building_materials, at a given size:
+    - realistic:  the model period 1721-2050 (T = 330), 26 regions & 12 building types
+    - stress:     T = 520 & 260 regions (12 building types)
+The methods of DynamicStockModel (compute_sf, compute_stock_driven_model with & without NegativeInflowCorrect,
+compute_stock_driven_model_initialstock_typesplit) work on one series (or one region, with the types) at a time,
+so these are run for a sample of the series (26, one building type) and the time per series is reported as well.
+The batched functions (stock model, material engine) are run for all series, on synthetic stocks & lifetimes (with a fixed seed).
+The stages of building_materials are run on the input files of the model (realistic size only, from the model folder).
+
+Each case is run repeat times for the wall time (the best & the median are kept), and once more with tracemalloc for the peak memory
+(numpy arrays are traced as well). The results of each run are appended to a JSON history file, and compared with a baseline file:
+a case is flagged as a regression if the best wall time or the peak memory is more than tolerance (default 20%) above the baseline.
+
+Usage (from the model folder):
+    python benchmark.py [--size realistic stress] [--cases stock_driven] [--repeat 3] [--save-baseline]
+
+dependencies:
+    numpy >= 1.9
+    pandas
+    scipy
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import tracemalloc
+import subprocess
+import numpy as np
+
+import dynamic_stock_model as dsm
+import material_engine
+
+sizes = {'realistic': {'Nt': 330, 'Nr': 26,  'Nb': 12, 'Nk': 7, 'future': 80},    # future: No of years from the switch time (1971) onwards, for the initial stock model
+         'stress':    {'Nt': 520, 'Nr': 260, 'Nb': 12, 'Nk': 7, 'future': 80}}
+sample = 26 # No of series for the methods of DynamicStockModel (one series at a time)
+
+
+#%% Synthetic data
+
+def synthetic_data(Nt, Nr, Nb, Nk, future, seed = 0):
+    """
+    Floorspace stocks Stock[b,r,t] (logistic growth, with a decline at the end for every third series, so that the negative inflow correction is used),
+    Weibull lifetimes by building type & region [b,r] and material intensities Intensity[b,r,c,k].
+    """
+    rng = np.random.default_rng(seed)
+    Year = np.arange(0,Nt)[np.newaxis,:]
+    Level  = rng.uniform(10, 1000, (Nb * Nr, 1))
+    Middle = rng.uniform(0.6, 0.9, (Nb * Nr, 1)) * Nt
+    Width  = rng.uniform(10, 30, (Nb * Nr, 1))
+    Stock  = Level / (1 + np.exp(-(Year - Middle) / Width))
+    Decline = np.where(np.arange(0, Nb * Nr)[:,np.newaxis] % 3 == 0, 0.3, 0.0) / (1 + np.exp(-(Year - (Nt - future / 2)) / 3))
+    Stock  = (Stock * (1 - Decline)).reshape(Nb, Nr, Nt)
+    lt = {'Type': 'Weibull', 'Shape': rng.uniform(1.5, 3.0, (Nb, Nr)), 'Scale': rng.uniform(40, 90, (Nb, Nr))}
+    Intensity = rng.uniform(0, 500, (Nb, Nr, 1, Nk)) * np.linspace(1.2, 0.8, Nt)[np.newaxis,np.newaxis,:,np.newaxis]
+    return {'Stock': Stock, 'lt': lt, 'Intensity': Intensity, 'future': future}
+
+
+def series_model(data, n, NegativeInflowCorrect = False):
+    """ DynamicStockModel of series n (n = b * Nr + r), with its total stock. """
+    Nb, Nr, Nt = data['Stock'].shape
+    return dsm.DynamicStockModel(t = np.arange(0,Nt,1), s = data['Stock'].reshape(Nb * Nr, Nt)[n],
+                                 lt = {'Type': data['lt']['Type'], 'Shape': np.full(Nt, data['lt']['Shape'].flat[n]), 'Scale': np.full(Nt, data['lt']['Scale'].flat[n])})
+
+
+def typesplit_inputs(data, r):
+    """
+    Inputs of compute_stock_driven_model_initialstock_typesplit for region r, with the building types as product types:
+    the stock by cohort at the switch time (from the stock driven model up to then), the sf by type & the future stock & type split.
+    """
+    Nb, Nr, Nt = data['Stock'].shape
+    SwitchTime = Nt - data['future']
+    t = np.arange(0,Nt,1)
+    lt = {'Type': data['lt']['Type'], 'Shape': data['lt']['Shape'][:,r], 'Scale': data['lt']['Scale'][:,r]}
+    SFArrayCombined = dsm.compute_sf_batch(t, lt, Nb).transpose(1,2,0)     # year x cohort x type
+    s_c, o_c, i = dsm.compute_stock_driven_model_batch(t[0:SwitchTime], data['Stock'][:,r,0:SwitchTime], lt)
+    InitialStock = np.zeros((Nt,Nb))
+    InitialStock[0:SwitchTime,:] = s_c[:,-1,:].transpose()
+    FutureStock = data['Stock'][:,r,SwitchTime:].sum(axis=0)
+    TypeSplit = data['Stock'][:,r,SwitchTime:].transpose() / FutureStock[:,np.newaxis]
+    return FutureStock, InitialStock, SFArrayCombined, TypeSplit
+
+
+#%% Cases
+
+def model_cases(data):
+    """ Benchmark cases on synthetic data: name -> (function, No of series it handles). """
+    Nb, Nr, Nt = data['Stock'].shape
+    t = np.arange(0,Nt,1)
+    Series = range(0, min(sample, Nb * Nr))
+    Regions = range(0, min(sample, Nr))
+    cases = {}
+
+    def sf():
+        dsm.sf_cache.clear()    # the tables of all series differ, but a rerun of the case would find them in the cache
+        for n in Series:
+            series_model(data, n).compute_sf()
+    cases['DynamicStockModel.compute_sf'] = (sf, len(Series))
+
+    def stock_driven(NegativeInflowCorrect):
+        def case():
+            dsm.sf_cache.clear()
+            for n in Series:
+                series_model(data, n).compute_stock_driven_model(NegativeInflowCorrect = NegativeInflowCorrect)
+        return case
+    cases['DynamicStockModel.compute_stock_driven_model'] = (stock_driven(False), len(Series))
+    cases['DynamicStockModel.compute_stock_driven_model_NIC'] = (stock_driven(True), len(Series))
+
+    Inputs = [typesplit_inputs(data, r) for r in Regions]
+    def typesplit():
+        for r in Regions:
+            FutureStock, InitialStock, SFArrayCombined, TypeSplit = Inputs[r]
+            Model = dsm.DynamicStockModel(t = t, s = FutureStock, lt = {'Type': data['lt']['Type']})
+            Model.compute_stock_driven_model_initialstock_typesplit(FutureStock, InitialStock, SFArrayCombined, TypeSplit)
+    cases['DynamicStockModel.compute_stock_driven_model_initialstock_typesplit'] = (typesplit, len(Regions) * Nb)
+
+    Flows = material_engine.compute_floorspace_flows(t, data['Stock'], data['lt'])
+    lt_sample = {ThisKey: (Value if ThisKey == 'Type' else Value[0:len(Series)]) for ThisKey, Value in material_engine.series_lifetime(data['lt'], Nb, Nr).items()}
+    cases['compute_sf_batch'] = (lambda: dsm.compute_sf_batch(t, lt_sample, len(Series)), len(Series))
+    cases['material_engine.compute_floorspace_flows'] = (lambda: material_engine.compute_floorspace_flows(t, data['Stock'], data['lt']), Nb * Nr)
+    cases['material_engine.compute_floorspace_flows_numpy'] = (lambda: material_engine.compute_floorspace_flows(t, data['Stock'], data['lt'], Kernel = 'numpy'), Nb * Nr) # the loop over the years in numpy, against the compiled one (with numba) above
+    cases['material_engine.compute_material_stocks'] = (lambda: material_engine.compute_material_stocks(t, Flows['m2_i'], Flows['correction'], data['lt'], data['Intensity']), Nb * Nr)
+    return cases
+
+
+def pipeline_cases(end_year = 2050):
+    """ The stages of building_materials (with the settings of the script), each with the results of the stages before it. """
+    import building_materials as bm
+    cases, results = {}, {}
+    file_addition = bm.intensity_file_addition(bm.flag_Mean)
+    stages = [('inputs',     lambda: bm.load_inputs(end_year, bm.flag_alpha, bm.inflation)),
+              ('demand',     lambda: bm.commercial_demand(results['inputs'], end_year, bm.flag_ExpDec, bm.expdec_parameters)),
+              ('tail',       lambda: bm.add_tail(results['inputs'], results['demand'], end_year, bm.tail_start, bm.ramp_length)),
+              ('floorspace', lambda: bm.square_meters(results['inputs'], results['tail'])),
+              ('dsm',        lambda: bm.stock_model(results['floorspace'], end_year = end_year, flag_Normal = bm.flag_Normal)),
+              ('material',   lambda: bm.material_flows(results['dsm'], end_year, file_addition, bm.cohort_detail)),
+              ('output',     lambda: bm.output_tables(results['dsm'], results['material'], end_year))]
+    for name, function in stages:
+        results[name] = function()     # once, as the input of the next stages
+        cases['building_materials.' + name] = (function, len(bm.building_names) * len(results['inputs']['regions']))
+    return cases
+
+
+#%% Measurements
+
+def measure(function, repeat = 3):
+    """ Best & median wall time (s) of repeat runs, & the peak traced memory (MB) of one more run. """
+    Times = []
+    for run in range(0, repeat):
+        Start = time.perf_counter()
+        function()
+        Times.append(time.perf_counter() - Start)
+    tracemalloc.start()
+    try:
+        function()
+        Peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'wall_s': min(Times), 'wall_median_s': float(np.median(Times)), 'repeat': repeat, 'peak_mb': Peak / 2**20}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(size = 'realistic', repeat = 3, select = None, pipeline = True, seed = 0):
+    """ Results of all cases (of which the name contains one of the strings in select, if given) at the given size, as a record of the history. """
+    cases = model_cases(synthetic_data(seed = seed, **sizes[size]))
+    if pipeline and size == 'realistic':
+        cases.update(pipeline_cases())
+    results = {}
+    for name, (function, series) in cases.items():
+        if select and not any(part in name for part in select):
+            continue
+        results[name] = dict(measure(function, repeat), series = series)
+        results[name]['wall_per_series_ms'] = 1000 * results[name]['wall_s'] / series
+        print('{0:<75} {1:>9.3f} s {2:>9.1f} MB'.format(name, results[name]['wall_s'], results[name]['peak_mb']))
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(), 'size': size, 'dimensions': sizes[size],
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.platform(), 'results': results}
+
+
+def regressions(record, baseline, tolerance = 0.2):
+    """ Cases of record that are slower (best wall time) or use more memory (peak) than the baseline (a record of the same size) by more than tolerance. """
+    flagged = []
+    for name, result in record['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        for metric in ['wall_s', 'peak_mb']:
+            if base[metric] > 0 and result[metric] > base[metric] * (1 + tolerance):
+                flagged.append({'case': name, 'metric': metric, 'value': result[metric], 'baseline': base[metric], 'ratio': result[metric] / base[metric]})
+    return flagged
+
+
+def load_json(path, default):
+    if not os.path.isfile(path):
+        return default
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_json(path, value):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(value, file, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the BUMA stock model & stages: wall time & peak memory.')
+    parser.add_argument('--size',     nargs='+', default=['realistic'], choices=sorted(sizes))
+    parser.add_argument('--cases',    nargs='+', default=None, help='only the cases of which the name contains one of these strings')
+    parser.add_argument('--repeat',   type=int, default=3)
+    parser.add_argument('--no-pipeline', action='store_true', help='skip the stages of building_materials')
+    parser.add_argument('--history',  default=os.path.join('benchmarks', 'history.json'))
+    parser.add_argument('--baseline', default=os.path.join('benchmarks', 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store the results of this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed increase of the wall time & peak memory over the baseline')
+    arguments = parser.parse_args()
+
+    history  = load_json(arguments.history, [])
+    baseline = load_json(arguments.baseline, {})
+    flagged = []
+    for size in arguments.size:
+        record = run_benchmarks(size, arguments.repeat, arguments.cases, not arguments.no_pipeline)
+        history.append(record)
+        if arguments.save_baseline:
+            baseline[size] = record
+        else:
+            for item in regressions(record, baseline.get(size, {}), arguments.tolerance):
+                flagged.append(item)
+                print('REGRESSION ({0}) {case}: {metric} {value:.3f} vs. {baseline:.3f} ({ratio:.2f}x)'.format(size, **item))
+    save_json(arguments.history, history)
+    if arguments.save_baseline:
+        save_json(arguments.baseline, baseline)
+    sys.exit(1 if flagged else 0)
+
+
+# The end.
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Demand curves for BUMA
+
+Commercial floorspace demand (m2/capita) as a function of the service value added per capita (SVA, in $/cap),
+following the fitted Gompertz curves (files_commercial/Gompertz_parameters.csv) or an exponential decay (ExpDec) curve.
+All functions work on arrays of any shape, e.g. sva[y,r] for year y & region r,
+or sva[s,y,r] with a leading scenario axis s to evaluate many SVA trajectories in one call.
+
+dependencies:
+    numpy >= 1.9
+"""
+
+import numpy as np
+
+
+def gompertz(sva, a, b, c):
+    """ Gompertz curve: a * exp(-b * exp(-c/1000 * sva)) """
+    return a * np.exp(-b * np.exp((-c/1000) * np.asarray(sva, dtype=float)))
+
+
+def expdec(sva, a, b, c, Minimum = 0.542):
+    """ Exponential decay curve: a - b * exp(-c/1000 * sva), but not lower than Minimum """
+    return np.maximum(Minimum, a - b * np.exp((-c/1000) * np.asarray(sva, dtype=float)))
+
+
+def commercial_split(sva, Parameters, Categories, Total, Minimum = 25):
+    """
+    Subdivide the Total commercial floorspace (same shape as sva) across Categories (e.g. Office, Retail+, Hotels+ & Govt+),
+    using the ratio between the Gompertz curves of each category. Parameters[category]['a'], ['b'] & ['c'] are the curve parameters,
+    e.g. the DataFrame of Gompertz_parameters.csv.
+
+    Returns:
+      Split[...,g,y,r],    the floorspace of category g; the category axis is inserted before the last two (year & region) axes of sva
+      Lowest[...,g],       the lowest m2/cap of the curve of each category over all years & regions (but not above Minimum),
+                           by scenario if sva has a leading scenario axis, used for the historic tail
+    """
+    sva    = np.asarray(sva, dtype=float)
+    Curves = np.stack([gompertz(sva, Parameters[Category]['a'], Parameters[Category]['b'], Parameters[Category]['c']) for Category in Categories], axis=-3)
+    Split  = np.asarray(Total, dtype=float)[...,np.newaxis,:,:] * (Curves / Curves.sum(axis=-3, keepdims=True))
+    Lowest = np.minimum(Minimum, Curves.min(axis=(-2,-1)))
+    return Split, Lowest
+
+
+# The end.
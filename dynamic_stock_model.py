@@ -19,19 +19,70 @@ standard abbreviation: DSM or dsm
 dependencies:
     numpy >= 1.9
     scipy >= 0.14
+    numba (optional, for the compiled kernel of the batched stock driven model, see dsm_kernel)
 
 Repository for this class, documentation, and tutorials: https://github.com/IndEcol/ODYM
 
 """
 
+import collections
 import numpy as np
+import dsm_kernel
 import scipy.stats
+import scipy.linalg
 
 def __version__():
     """Return a brief version string and statement for this class."""
     return str('1.0'), str('Class DynamicStockModel, dsm. Version 1.0. Last change: July 25th, 2019. Check https://github.com/IndEcol/ODYM for latest version.')
 
 
+class SurvivalFunctionCache(object):
+
+    """ Process-wide least-recently-used cache of survival tables (sf), shared by all dynamic stock models.
+
+    The key is made up of the distribution type, the lifetime parameters and the length of the time vector.
+    Cached tables are stored read-only, so that no model can alter the sf of another model by accident.
+    Set maxsize to 0 to disable the cache.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.clear()
+
+    def get(self, key):
+        """Return the cached sf for key and mark it as most recently used, or None (a miss)."""
+        if key in self.tables:
+            self.tables.move_to_end(key)
+            self.hits += 1
+            return self.tables[key]
+        else:
+            self.misses += 1
+            return None
+
+    def put(self, key, sf):
+        """Store sf under key, evicting the least recently used tables when the cache is full."""
+        if self.maxsize > 0:
+            sf.setflags(write=False)
+            self.tables[key] = sf
+            self.tables.move_to_end(key)
+            while len(self.tables) > self.maxsize:
+                self.tables.popitem(last=False)
+
+    def clear(self):
+        """Empty the cache and reset the hit/miss statistics."""
+        self.tables = collections.OrderedDict()
+        self.hits   = 0
+        self.misses = 0
+
+    def info(self):
+        """Return a dictionary with the hit/miss statistics and the current size of the cache."""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.tables), 'maxsize': self.maxsize}
+
+
+sf_cache = SurvivalFunctionCache()
+
+
+
 class DynamicStockModel(object):
 
     """ Class containing a dynamic stock model
@@ -87,6 +138,7 @@ class DynamicStockModel(object):
 
         self.pdf = pdf # optional
         self.sf  = sf # optional
+        self.sd_operator = None # optional, see compute_stock_driven_operator
 
     """ Part 1: Checks and balances: """
 
@@ -214,54 +266,29 @@ class DynamicStockModel(object):
         This is the only method for the inflow-driven model where the lifetime distribution directly enters the computation. All other stock variables are determined by mass balance.
         The shape of the output sf array is NoofYears * NoofYears, and the meaning is years by age-cohorts.
         The method does nothing if the sf alreay exists. For example, sf could be assigned to the dynamic stock model from an exogenous computation to save time.
+        Survival tables taken from the cache are read-only, as they are shared between dynamic stock models with the same lifetime distribution.
         """
         if self.sf is None:
-            self.sf = np.zeros((len(self.t), len(self.t)))
-            # Perform specific computations and checks for each lifetime distribution:
-
-            if self.lt['Type'] == 'Fixed': # fixed lifetime, age-cohort leaves the stock in the model year when the age specified as 'Mean' is reached.
-                for m in range(0, len(self.t)):  # cohort index
-                    self.sf[m::,m] = np.multiply(1, (np.arange(0,len(self.t)-m) < self.lt['Mean'][m])) # converts bool to 0/1
-                # Example: if Lt is 3.5 years fixed, product will still be there after 0, 1, 2, and 3 years, gone after 4 years.
-
-            if self.lt['Type'] == 'Normal': # normally distributed lifetime with mean and standard deviation. Watch out for nonzero values 
-                # for negative ages, no correction or truncation done here. Cf. note below.
-                for m in range(0, len(self.t)):  # cohort index
-                    if self.lt['Mean'][m] != 0:  # For products with lifetime of 0, sf == 0
-                        self.sf[m::,m] = scipy.stats.norm.sf(np.arange(0,len(self.t)-m), loc=self.lt['Mean'][m], scale=self.lt['StdDev'][m])
-                        # NOTE: As normal distributions have nonzero pdf for negative ages, which are physically impossible, 
-                        # these outflow contributions can either be ignored (violates the mass balance) or
-                        # allocated to the zeroth year of residence, the latter being implemented in the method compute compute_o_c_from_s_c.
-                        # As alternative, use lognormal or folded normal distribution options.
-                        
-            if self.lt['Type'] == 'FoldedNormal': # Folded normal distribution, cf. https://en.wikipedia.org/wiki/Folded_normal_distribution
-                for m in range(0, len(self.t)):  # cohort index
-                    if self.lt['Mean'][m] != 0:  # For products with lifetime of 0, sf == 0
-                        self.sf[m::,m] = scipy.stats.foldnorm.sf(np.arange(0,len(self.t)-m), self.lt['Mean'][m]/self.lt['StdDev'][m], 0, scale=self.lt['StdDev'][m])
-                        # NOTE: call this option with the parameters of the normal distribution mu and sigma of curve BEFORE folding,
-                        # curve after folding will have different mu and sigma.
-                        
-            if self.lt['Type'] == 'LogNormal': # lognormal distribution
-                # Here, the mean and stddev of the lognormal curve, 
-                # not those of the underlying normal distribution, need to be specified! conversion of parameters done here:
-                for m in range(0, len(self.t)):  # cohort index
-                    if self.lt['Mean'][m] != 0:  # For products with lifetime of 0, sf == 0
-                        # calculate parameter mu    of underlying normal distribution:
-                        LT_LN = np.log(self.lt['Mean'][m] / np.sqrt(1 + self.lt['Mean'][m] * self.lt['Mean'][m] / (self.lt['StdDev'][m] * self.lt['StdDev'][m]))) 
-                        # calculate parameter sigma of underlying normal distribution:
-                        SG_LN = np.sqrt(np.log(1 + self.lt['Mean'][m] * self.lt['Mean'][m] / (self.lt['StdDev'][m] * self.lt['StdDev'][m])))
-                        # compute survial function
-                        self.sf[m::,m] = scipy.stats.lognorm.sf(np.arange(0,len(self.t)-m), s=SG_LN, loc = 0, scale=np.exp(LT_LN)) 
-                        # values chosen according to description on
-                        # https://docs.scipy.org/doc/scipy-0.13.0/reference/generated/scipy.stats.lognorm.html
-                        # Same result as EXCEL function "=LOGNORM.VERT(x;LT_LN;SG_LN;TRUE)"
-                        
-            if self.lt['Type'] == 'Weibull': # Weibull distribution with standard definition of scale and shape parameters
-                for m in range(0, len(self.t)):  # cohort index
-                    if self.lt['Shape'][m] != 0:  # For products with lifetime of 0, sf == 0
-                        self.sf[m::,m] = scipy.stats.weibull_min.sf(np.arange(0,len(self.t)-m), c=self.lt['Shape'][m], loc = 0, scale=self.lt['Scale'][m])
-
-
+            Nt = len(self.t)
+            # The survival function only depends on the age (year - cohort). If the lifetime parameters are the same for all cohorts,
+            # the distribution is evaluated once for all ages and the table is a shifted copy of this age vector (Toeplitz matrix).
+            # Otherwise, the distribution is evaluated for the full year-by-cohort table at once.
+            # Tables are shared through the process-wide sf_cache, keyed by distribution type, parameters and time length.
+            Params = {ThisKey: np.asarray(self.lt[ThisKey], dtype=float)[0:Nt] for ThisKey in self.lt.keys() if ThisKey != 'Type'}
+            Constant = all((Params[ThisKey] == Params[ThisKey][0]).all() for ThisKey in Params.keys())
+            if Constant:
+                CacheKey = (self.lt['Type'], Nt) + tuple((ThisKey, float(Params[ThisKey][0])) for ThisKey in sorted(Params.keys()))
+            else:
+                CacheKey = (self.lt['Type'], Nt) + tuple((ThisKey, Params[ThisKey].tobytes()) for ThisKey in sorted(Params.keys()))
+            self.sf = sf_cache.get(CacheKey)
+            if self.sf is None:
+                if Constant:
+                    sf_age = compute_sf_by_age(self.lt['Type'], np.arange(0,Nt), **{ThisKey: Params[ThisKey][0] for ThisKey in Params.keys()})
+                    self.sf = np.tril(scipy.linalg.toeplitz(sf_age))
+                else:
+                    Age = np.subtract.outer(np.arange(0,Nt), np.arange(0,Nt)) # year m minus cohort n
+                    self.sf = np.tril(compute_sf_by_age(self.lt['Type'], Age, **Params))
+                sf_cache.put(CacheKey, self.sf)
             return self.sf
         else:
             # sf already exists
@@ -381,8 +408,12 @@ class DynamicStockModel(object):
                     self.i[0] = self.s[0] / self.sf[0, 0]
                 self.s_c[:, 0] = self.i[0] * self.sf[:, 0] # Future decay of age-cohort of year 0.
                 self.o_c[0, 0] = self.i[0] - self.s_c[0, 0]
+                # Cumulative correction factor by age-cohort, see 2a) below:
+                Factor = np.ones(len(self.t))
                 # all other years:
                 for m in range(1, len(self.t)):  # for all years m, starting in second year
+                    if NegativeInflowCorrect is True: # With the correction, the stock of previous age-cohorts is materialized year by year:
+                        self.s_c[m, 0:m] = self.i[0:m] * self.sf[m, 0:m] * Factor[0:m]
                     # 1) Compute outflow from previous age-cohorts up to m-1
                     self.o_c[m, 0:m] = self.s_c[m-1, 0:m] - self.s_c[m, 0:m] # outflow table is filled row-wise, for each year m.
                     # 2) Determine inflow from mass balance:
@@ -408,13 +439,15 @@ class DynamicStockModel(object):
                             # correct for outflow and stock in current and future years
                             # adjust the entire stock AFTER year m as well, stock is lowered in year m, so future cohort survival also needs to decrease.
                             self.o_c[m, :] = self.o_c[m, :] + (self.s_c[m, :] * Delta_percent)  # increase outflow according to the lost fraction of the stock, based on Delta_c
-                            self.s_c[m::,0:m] = self.s_c[m::,0:m] * (1-Delta_percent) # shrink future description of stock from previous age-cohorts by factor Delta_percent in current AND future years.
+                            self.s_c[m,0:m] = self.s_c[m,0:m] * (1-Delta_percent) # shrink stock from previous age-cohorts by factor Delta_percent in current year.
+                            Factor[0:m]     = Factor[0:m] * (1-Delta_percent)     # and in future years, applied when the stock of these years is computed.
+                            # (Instead of rescaling the whole future sub-matrix s_c[m::,0:m] here, which makes the method O(T^3).)
                         else: # If no negative inflow would occur
                             if self.sf[m,m] != 0: # Else, inflow is 0.
                                 self.i[m] = (self.s[m] - self.s_c[m, :].sum()) / self.sf[m,m] # allow for outflow during first year by rescaling with 1/sf[m,m]    
-                            # Add new inflow to stock and determine future decay of new age-cohort
-                            self.s_c[m::, m] = self.i[m] * self.sf[m::, m]
-                            self.o_c[m, m]   = self.i[m] * (1 - self.sf[m, m])                                
+                            # Add new inflow to stock, future decay of new age-cohort follows from i, sf and Factor
+                            self.s_c[m, m] = self.i[m] * self.sf[m, m]
+                            self.o_c[m, m] = self.i[m] * (1 - self.sf[m, m])                                
                         # NOTE: This method of negative inflow correction is only of of many plausible methods of increasing the outflow to keep matching stock levels.
                         # It assumes that the surplus stock is removed in the year that it becomes obsolete. Each cohort loses the same fraction.
                         # Modellers need to try out whether this method leads to justifiable results.
@@ -429,6 +462,59 @@ class DynamicStockModel(object):
             return None, None, None
         
 
+    def compute_stock_driven_operator(self):
+        """ Without negative inflow correction, the stock-driven model is linear: s = sf * i, with sf lower-triangular (year x age-cohort).
+        The year-by-year computation of compute_stock_driven_model is a forward substitution with this matrix.
+        This method prepares the operator once per lifetime distribution: 
+        For years with sf[m,m] = 0 the row is replaced by a unit row, so that, with a zero stock entry, the inflow in that year is 0 as in the recursion.
+        The method does nothing if the operator already exists.
+        """
+        if self.sd_operator is None:
+            self.compute_sf()
+            Operator = np.array(self.sf) # copy, the sf may be shared with other models through the sf_cache
+            ZeroDiag = Operator.diagonal() == 0
+            Operator[ZeroDiag,:] = 0
+            Operator[ZeroDiag,ZeroDiag] = 1
+            self.sd_operator = Operator
+        return self.sd_operator
+
+    def compute_stock_driven_model_linear(self, Stocks, CohortDetail = False):
+        """ Stock-driven model without negative inflow correction for any number of stock trajectories, using the precomputed operator.
+        
+        Data:
+          Stocks[k,t],      total stock by trajectory k (e.g. Monte Carlo draw) and year t. A single trajectory s[t] is also accepted.
+          CohortDetail      BOOL, if True stock and outflow by cohort are returned as well (memory: trajectories x years x years).
+        
+        All trajectories are solved with one triangular solve against the operator (see compute_stock_driven_operator),
+        the outflows follow from the pdf with a matrix product. The results are the same as calling compute_stock_driven_model(NegativeInflowCorrect = False)
+        for each trajectory, up to floating-point rounding. The results are returned and not stored in the model.
+        Returns i[k,t], o[k,t] and, with CohortDetail, s_c[k,t,c] and o_c[k,t,c].
+        """
+        if self.lt is not None:
+            Stocks = np.array(Stocks, dtype=float)
+            Single = Stocks.ndim == 1
+            Stocks = np.atleast_2d(Stocks)
+            Operator = self.compute_stock_driven_operator()
+            self.compute_outflow_pdf()
+            RHS = Stocks.transpose().copy()        # years x trajectories
+            RHS[self.sf.diagonal() == 0,:] = 0     # Inflow is 0 in these years
+            i = scipy.linalg.solve_triangular(Operator, RHS, lower=True).transpose()
+            o = np.einsum('tc,kc->kt', self.pdf, i)
+            if CohortDetail is True:
+                s_c = np.einsum('tc,kc->ktc', self.sf, i)
+                o_c = np.einsum('tc,kc->ktc', self.pdf, i)
+                if Single:
+                    return i[0], o[0], s_c[0], o_c[0]
+                return i, o, s_c, o_c
+            if Single:
+                return i[0], o[0]
+            return i, o
+        else:
+            # No lifetime distribution specified
+            if CohortDetail is True:
+                return None, None, None, None
+            return None, None
+
     def compute_stock_driven_model_initialstock(self,InitialStock,SwitchTime,NegativeInflowCorrect = False):
         """ With given total stock and lifetime distribution, the method builds the stock by cohort and the inflow.
         The extra parameter InitialStock is a vector that contains the age structure of the stock at the END of the year Switchtime -1 = t0.
@@ -444,6 +530,7 @@ class DynamicStockModel(object):
             InitialStock must have length = SwithTime -1.
         For the option "NegativeInflowCorrect", see the explanations for the method compute_stock_driven_model(self, NegativeInflowCorrect = True).
         NegativeInflowCorrect only affects the future stock time series and works exactly as for the stock-driven model without initial stock.
+        This method is not compiled (numpy only), for many series use compute_stock_driven_model_batch with InitialStock (see dsm_kernel).
         """
         if self.s is not None:
             if self.lt is not None:
@@ -481,7 +568,9 @@ class DynamicStockModel(object):
                         self.o_c[m, m]    = self.i[m] * (1 - self.sf[m, m])
                         self.o_c[m+1::,m] = self.s_c[m:-1,m] - self.s_c[m+1::,m]
                 if NegativeInflowCorrect is True:
+                    Factor = np.ones(len(self.t)) # cumulative correction factor by age-cohort, applied when the stock of year m is computed.
                     for m in range(SwitchTime-1, len(self.t)):  # for all years m, starting at SwitchTime
+                        self.s_c[m, 0:m] = self.i[0:m] * self.sf[m, 0:m] * Factor[0:m]
                         self.o_c[m, 0:m] = self.s_c[m-1, 0:m] - self.s_c[m, 0:m] # outflow table is filled row-wise, for each year m.
                         # 1) Determine text inflow from mass balance:
                         InflowTest = self.s[m] - self.s_c[m, :].sum()
@@ -500,12 +589,13 @@ class DynamicStockModel(object):
                             # print((self.s_c[m, :] * Delta_percent).sum())
                             # print('_')
                             self.o_c[m, :] = self.o_c[m, :] + (self.s_c[m, :] * Delta_percent).copy()  # increase outflow according to the lost fraction of the stock, based on Delta_c
-                            self.s_c[m::,0:m] = self.s_c[m::,0:m] * (1-Delta_percent.copy()) # shrink future description of stock from previous age-cohorts by factor Delta_percent in current AND future years.
+                            self.s_c[m,0:m] = self.s_c[m,0:m] * (1-Delta_percent) # shrink stock from previous age-cohorts by factor Delta_percent in current year,
+                            Factor[0:m]     = Factor[0:m] * (1-Delta_percent)     # and in future years.
                         else:
                             if self.sf[m,m] != 0: # Else, inflow is 0.
                                 self.i[m] = (self.s[m] - self.s_c[m, :].sum()) / self.sf[m,m] # allow for outflow during first year by rescaling with 1/sf[m,m]
-                            # 2) Add new inflow to stock and determine future decay of new age-cohort
-                            self.s_c[m::, m]  = self.i[m] * self.sf[m::, m]
+                            # 2) Add new inflow to stock, future decay of new age-cohort follows from i, sf and Factor
+                            self.s_c[m, m]    = self.i[m] * self.sf[m, m]
                             self.o_c[m, m]    = self.i[m] * (1 - self.sf[m, m])
                 # Add historic stock series to total stock s:
                 self.s[0:SwitchTime-1]= self.s_c[0:SwitchTime-1,:].sum(axis =1).copy()                    
@@ -544,7 +634,8 @@ class DynamicStockModel(object):
         In the year SwitchTime the model switches from the historic stock to the stock-driven approach.
         Only future years, i.e., years after SwitchTime, are computed and returned.
         The InitialStock is a vector of the age-cohort composition of the stock at SwitchTime, with length SwitchTime.
-        The parameter TypeSplit splits the total inflow into Ng types. """
+        The parameter TypeSplit splits the total inflow into Ng types.
+        This method is not compiled (numpy only), see dsm_kernel. """
         
         if self.s is not None:
             if self.lt is not None:
@@ -634,7 +725,8 @@ class DynamicStockModel(object):
         In the year SwitchTime the model switches from the historic stock to the stock-driven approach.
         Only future years, i.e., years after SwitchTime, are computed and returned.
         The InitialStock is a vector of the age-cohort composition of the stock at SwitchTime, with length SwitchTime.
-        The parameter TypeSplit splits the total inflow into Ng types. """
+        The parameter TypeSplit splits the total inflow into Ng types.
+        This method is not compiled (numpy only), see dsm_kernel. """
         
         if self.s is not None:
             if self.lt is not None:
@@ -694,7 +786,11 @@ class DynamicStockModel(object):
                             o_cg[m+1::,m,g] = s_cg[m:-1,m,g] - s_cg[m+1::,m,g]
                             
                 if NegativeInflowCorrect is True:
+                    Factor = np.ones(Ntt) # cumulative correction factor by age-cohort, applied when the stock of year m is computed.
                     for m in range(SwitchTime, len(self.t)):  # for all years m, starting at SwitchTime
+                        # 0) Stock of previous age-cohorts at the end of year m, and their outflow during year m:
+                        s_cg[m,:,:]     = i_g * SFArrayCombined[m,:,:] * Factor[:,np.newaxis]
+                        o_cg[m,0:m,:]   = s_cg[m-1,0:m,:] - s_cg[m,0:m,:]
                         # 1) Determine inflow from mass balance:
                         i0_test = self.s[m] - s_cg[m,:,:].sum()
                         if i0_test < 0:
@@ -710,8 +806,8 @@ class DynamicStockModel(object):
                             # correct for outflow and stock in current and future years
                             # adjust the entire stock AFTER year m as well, stock is lowered in year m, so future cohort survival also needs to decrease.
                             o_cg[m, :,:]    = o_cg[m, :,:]    + (s_cg[m, :,:] * Delta_percent).copy()  # increase outflow according to the lost fraction of the stock, based on Delta_c
-                            s_cg[m::,0:m,:] = s_cg[m::,0:m,:] * (1-Delta_percent.copy())               # shrink future description of stock from previous age-cohorts by factor Delta_percent in current AND future years.
-                            o_cg[m+1::,:,:] = s_cg[m:-1,:,:] - s_cg[m+1::,:,:]                         # recalculate future outflows
+                            s_cg[m,0:m,:]   = s_cg[m,0:m,:] * (1-Delta_percent)                        # shrink stock from previous age-cohorts by factor Delta_percent in current year,
+                            Factor[0:m]     = Factor[0:m] * (1-Delta_percent)                          # and in future years (future outflows follow in step 0 of these years).
                         
                         else:       
                             for g in range(0,Ng):
@@ -720,10 +816,9 @@ class DynamicStockModel(object):
                                     # NOTE: The stock-driven method may lead to negative inflows, if the stock development is in contradiction with the lifetime model.
                                     # In such situations the lifetime assumption must be changed, either by directly using different lifetime values or by adjusting the outlfows, 
                                     # cf. the option NegativeInflowCorrect in the method compute_stock_driven_model.
-                                    # 2) Add new inflow to stock and determine future decay of new age-cohort
-                                s_cg[m::,m,g]   = i_g[m,g] * SFArrayCombined[m::,m,g]
+                                    # 2) Add new inflow to stock, future decay of new age-cohort follows from i_g, SFArrayCombined and Factor
+                                s_cg[m,m,g]     = i_g[m,g] * SFArrayCombined[m,m,g]
                                 o_cg[m,m,g]     = i_g[m,g] * (1 - SFArrayCombined[m,m,g])
-                                o_cg[m+1::,m,g] = s_cg[m:-1,m,g] - s_cg[m+1::,m,g]    
                                 
                 # Add total values of parameter to enable mass balance check:
                 self.s_c = s_cg.sum(axis =2)
@@ -738,8 +833,416 @@ class DynamicStockModel(object):
         else:
             # No stock specified
             return None, None, None, None
-      
-        
+
+
+
+"""
+Part 5: Batched stock driven model
+Given: total stock for several series (e.g. regions), lifetime dist. by series.
+The year-by-year mass balance is advanced for all series at once.
+"""
+
+def compute_sf_age_batch(t, lt, Nn):
+    """ Survival by age sf_age[n,a] (age a = 0 ... len(t)-1) of Nn series, with the lifetime parameters in lt given by series (shape n),
+    evaluated for all series at once. The sf of year m and age-cohort c is sf_age[n,m-c].
+    Returns None if a parameter is given by series and age-cohort (shape n,t), the sf then differs by age-cohort, see compute_sf_batch. """
+    Params = {ThisKey: np.asarray(lt[ThisKey], dtype=float) for ThisKey in lt.keys() if ThisKey != 'Type'}
+    if any(Params[ThisKey].ndim > 1 for ThisKey in Params.keys()):
+        return None
+    return compute_sf_by_age(lt['Type'], np.arange(0,len(t))[np.newaxis,:], **{ThisKey: np.broadcast_to(Params[ThisKey], (Nn,))[:,np.newaxis] for ThisKey in Params.keys()})
+
+
+def compute_sf_batch(t, lt, Nn):
+    """ Survival tables sf[n,t,c] of Nn series, with the lifetime parameters in lt given by series (shape n) or by series and age-cohort (shape n,t). """
+    Nt = len(t)
+    sf_age = compute_sf_age_batch(t, lt, Nn)
+    if sf_age is not None: # the same lifetime for all age-cohorts: shifted copies of the sf by age (Toeplitz tables)
+        return np.tril(sf_age[:,np.maximum(np.subtract.outer(np.arange(0,Nt), np.arange(0,Nt)), 0)])
+    sf = np.zeros((Nn,Nt,Nt))
+    for n in range(0,Nn):
+        lt_n = {'Type': lt['Type']}
+        for ThisKey in lt.keys():
+            if ThisKey != 'Type':
+                lt_n[ThisKey] = np.array(lt[ThisKey], dtype=float)[n] * np.ones(Nt) # scalar by series is replicated to full length of the time vector
+        sf[n,:,:] = DynamicStockModel(t=t, lt=lt_n).compute_sf()
+    return sf
+
+
+def compute_max_age_batch(t, lt, Nn, Tolerance):
+    """ Age from which the survival of all Nn series (and age-cohorts) is at most Tolerance, for the banded stock model (see MaxAge of
+    compute_stock_driven_model_batch): an inflow leaves the stock within MaxAge years, except for at most a share Tolerance of it.
+    Returns MaxAge (len(t) if the sf is above Tolerance up to the end of the time axis) and Residual[n], the largest sf of series n
+    at the age MaxAge or older: the share of an inflow that the cut-off removes from the stock early, at most. """
+    Nt = len(t)
+    sf_age = compute_sf_age_batch(t, lt, Nn)
+    if sf_age is None: # the largest sf by age over all age-cohorts (the sf of age a are the a-th subdiagonal of the year-by-cohort table)
+        sf = compute_sf_batch(t, lt, Nn)
+        sf_age = np.stack([np.diagonal(sf, offset=-a, axis1=1, axis2=2).max(axis=1) for a in range(0,Nt)], axis=1)
+    Above  = sf_age > Tolerance
+    MaxAge = int(np.max(np.where(Above.any(axis=1), Nt - np.argmax(Above[:,::-1], axis=1), 0))) # one more than the oldest age above Tolerance
+    Residual = sf_age[:,MaxAge:].max(axis=1) if MaxAge < Nt else np.zeros(Nn)
+    return MaxAge, Residual
+
+
+def compute_truncation_bound_batch(i, Residual, MaxAge):
+    """ Upper bound Bound[n,t] of the stock that the age-cohorts of MaxAge years or older would still hold in year t without the cut-off
+    (see compute_max_age_batch): the Residual share of their inflow. This is the stock by which the banded & the full model differ in a year,
+    for the same inflows. """
+    i = np.abs(np.asarray(i, dtype=float))
+    Bound = np.zeros(i.shape)
+    if MaxAge < i.shape[1]:
+        Bound[:,MaxAge:] = Residual[:,np.newaxis] * np.cumsum(i, axis=1)[:,0:i.shape[1]-MaxAge]
+    return Bound
+
+
+def compute_lagged_view(X, Width, FirstYear = 0):
+    """ View V[n,t,a,...] = X[n,t-a,...] of X[n,c,...] by age a = 0 ... Width-1 instead of by age-cohort c (0 where t-a < 0),
+    for the years t = FirstYear ... len(c)-1, e.g. the inflow or intensity of the age-cohort of each age in a banded table.
+    X is padded with Width zeros before the first age-cohort, the view itself is read-only & takes no memory. """
+    X = np.asarray(X, dtype=float)
+    Padded = np.concatenate((np.zeros((X.shape[0], Width) + X.shape[2:]), X), axis=1)
+    Strides = Padded.strides
+    return np.lib.stride_tricks.as_strided(Padded[:,Width+FirstYear:], shape=(X.shape[0], X.shape[1]-FirstYear, Width) + X.shape[2:],
+                                           strides=(Strides[0], Strides[1], -Strides[1]) + Strides[2:], writeable=False)
+
+
+def compute_cohorts_from_band(Band, FirstYear = 0):
+    """ Year-by-cohort table [n,t,c] from a banded table by age Band[n,t,a] (the age-cohort of age a in year t is t-a),
+    e.g. the s_c & o_c of compute_stock_driven_cohorts_batch with MaxAge. The year axis of Band starts at FirstYear. """
+    Nn, Ny, W = Band.shape
+    Nt = FirstYear + Ny
+    Cohort = np.arange(FirstYear, Nt)[:,np.newaxis] - np.arange(0,W)[np.newaxis,:] # [t,a]
+    Valid  = Cohort >= 0
+    Rows   = np.broadcast_to(np.arange(0,Ny)[:,np.newaxis], Cohort.shape)
+    Table  = np.zeros((Nn,Ny,Nt))
+    Table[:,Rows[Valid],Cohort[Valid]] = Band[:,Valid]
+    return Table
+
+
+def compute_stock_driven_model_batch(t, s, lt, NegativeInflowCorrect = False, NonNegativeOutflow = False, Intensity = None, ReturnCorrection = False,
+                                     InitialStock = None, SwitchTime = None, Resume = None, CheckpointYears = (), MaxAge = None, Kernel = 'auto'):
+    """ Stock driven model for several independent series (e.g. regions) at once.
+
+    Data:
+      t[t],                     time vector, shared by all series
+      s[n,t],                   total stock by series n and year t
+      lt,                       lifetime distribution: dictionary with 'Type' and the parameters of that type,
+                                each given either by series (shape n) or by series and age-cohort (shape n,t)
+      NegativeInflowCorrect     BOOL, see compute_stock_driven_model. The correction is applied with masks to those series
+                                where the mass balance would yield a negative inflow in year m.
+      NonNegativeOutflow        BOOL, set negative outflow by cohort (a possible consequence of the negative inflow correction) to zero.
+      Intensity[n,c,k],         optional, e.g. material content per unit of stock by series, age-cohort and material k.
+                                If given, the stock and outflow by cohort are contracted with it as soon as each year is computed,
+                                so that the year-by-cohort tables are never held in memory.
+      ReturnCorrection          BOOL, also return Correction[n,t]: the factor (1 - Delta_percent) by which the stock of all previous age-cohorts
+                                was shrunk by the negative inflow correction in year t (1 in years without correction).
+                                Together with i, this is all that is needed to rebuild s_c and o_c, see compute_stock_driven_cohorts_batch.
+      InitialStock[n,c],        optional, the stock by age-cohort c = 0 ... SwitchTime-2 at the END of year SwitchTime-2 (SwitchTime counted from 1),
+                                as in DynamicStockModel.compute_stock_driven_model_initialstock. The historic inflows follow from the initial stock & the sf,
+                                and the mass balance is only solved from year SwitchTime-1 onwards (the stock s of the earlier years is not used).
+                                The year axis of s_c & o_c (or s_k & o_k) then starts at year SwitchTime-2 (the year of the initial stock),
+                                i & Correction keep the full time axis (the age-cohorts).
+      Resume,                   optional, the state of the recursion at the end of a year m (a checkpoint, see CheckpointYears) of an earlier run
+                                with the same lifetimes, settings & stock up to year m: the run continues from year m+1, the results up to year m are
+                                those of the checkpoint. The time axis may be longer than that of the earlier run (e.g. a later end year).
+      CheckpointYears           the years (indices of t) at the end of which the state of the recursion is kept, if any, the checkpoints are
+                                returned as an extra result: a dictionary of year: state (the inflow, the correction factors, the stock by cohort
+                                of that year & the results up to that year), to be passed as Resume.
+      MaxAge                    optional, banded tables: the lifetime distribution is cut off at this age (the stock left of an age-cohort leaves
+                                in the year it reaches MaxAge), so only the age-cohorts of the last MaxAge years are computed in each year.
+                                Time & memory are then O(t x MaxAge) instead of O(t x t). See compute_max_age_batch for the age at which the sf
+                                falls below a tolerance, and compute_truncation_bound_batch for the error of the cut-off.
+                                Without Intensity, s_c & o_c are returned by age a = 0 ... MaxAge instead of by age-cohort: s_c[n,t,a]
+                                (see compute_cohorts_from_band).
+      Kernel                    'auto': the recursion compiled with numba (see dsm_kernel) if numba is installed, for lifetimes by series
+                                & with Intensity, else the numpy loop below; 'numpy': always the numpy loop; 'jit': the compiled recursion
+                                (ImportError without numba). The results are the same up to rounding.
+
+    Returns the stacked results s_c[n,t,c], o_c[n,t,c] and i[n,t], which equal the results of
+    DynamicStockModel.compute_stock_driven_model for each series separately.
+    With Intensity, s_k[n,t,k] = sum_c s_c[n,t,c] * Intensity[n,c,k] and o_k[n,t,k] (same for the outflow) are returned instead of s_c and o_c.
+    Instead of rescaling the future stock of previous age-cohorts in each year with a negative inflow,
+    the correction is kept as a cumulative factor by age-cohort, which is applied when the stock of year m is computed.
+    """
+    s  = np.asarray(s, dtype=float)
+    Nn = s.shape[0] # No of series
+    Nt = len(t)     # No of years
+    if Resume is not None:
+        First = Resume['First'] # first year of the results
+    else:
+        First = 0 if InitialStock is None else SwitchTime - 2
+
+    # construct the sf of each series, by age only if the lifetime is the same for all age-cohorts (the year-by-cohort tables are not needed then)
+    sf_age = compute_sf_age_batch(t, lt, Nn)
+    if sf_age is None:
+        sf = compute_sf_batch(t, lt, Nn)
+    if MaxAge is not None: # the lifetime distribution is cut off at MaxAge
+        if sf_age is None:
+            sf = sf * (np.subtract.outer(np.arange(0,Nt), np.arange(0,Nt)) < MaxAge)
+        else:
+            sf_age = np.where(np.arange(0,Nt) < MaxAge, sf_age, 0)
+    Width = Nt if MaxAge is None else min(MaxAge + 1, Nt) # No of age-cohorts in the stock & outflow of a year
+
+    def sf_year(m): # sf of year m by series and age-cohort
+        if sf_age is None:
+            return sf[:,m,:]
+        sf_m = np.zeros((Nn,Nt))
+        sf_m[:,0:m+1] = sf_age[:,m::-1] # age m ... 0 for age-cohorts 0 ... m
+        return sf_m
+
+    if Intensity is None:
+        s_c = np.zeros((Nn,Nt-First,Width))
+        o_c = np.zeros((Nn,Nt-First,Width))
+    else:
+        s_c = np.zeros((Nn,Nt-First,Intensity.shape[2]))
+        o_c = np.zeros((Nn,Nt-First,Intensity.shape[2]))
+    i      = np.zeros((Nn,Nt))
+    Factor = np.ones((Nn,Nt))  # cumulative correction factor by series and age-cohort, from negative inflow corrections in earlier years
+    Correction = np.ones((Nn,Nt)) # correction factor by series and year
+    s_c_m  = np.zeros((Nn,Nt)) # stock by cohort at the end of year m, only the current and previous year are needed for the recursion
+
+    if Resume is not None:
+        # continue from the checkpoint: the state at the end of its year & the results up to that year
+        Start = Resume['Year'] + 1
+        i[:,0:Start]          = Resume['i']
+        Factor[:,0:Start]     = Resume['Factor']
+        Correction[:,0:Start] = Resume['Correction']
+        s_c_m[:,0:Start]      = Resume['s_c']
+        s_c[:,0:Start-First,0:Resume['s_out'].shape[2]] = Resume['s_out']
+        o_c[:,0:Start-First,0:Resume['o_out'].shape[2]] = Resume['o_out']
+    elif InitialStock is not None:
+        # historic inflows, such that the survivors at the end of year SwitchTime-2 are the initial stock (or the initial stock itself where the sf is 0)
+        InitialStock = np.asarray(InitialStock, dtype=float)
+        sf_First = sf_year(First)[:,0:First+1]
+        i[:,0:First+1] = InitialStock
+        np.divide(InitialStock, sf_First, out=i[:,0:First+1], where=sf_First != 0)
+        if First > 0:
+            s_c_m = i * sf_year(First-1) # stock in the year before the initial stock, for the outflow of that year
+
+    Checkpoints = {}
+    def checkpoint(m): # the state of the recursion at the end of year m (copies, the arrays are changed in later years)
+        Checkpoints[m] = {'Year': m, 'First': First, 'i': i[:,0:m+1].copy(), 'Factor': Factor[:,0:m+1].copy(), 'Correction': Correction[:,0:m+1].copy(),
+                          's_c': s_c_m[:,0:m+1].copy(), 's_out': s_c[:,0:m+1-First,:].copy(), 'o_out': o_c[:,0:m+1-First,:].copy()}
+
+    Compiled = None
+    if Kernel != 'numpy' and Intensity is not None and sf_age is not None:
+        Compiled = dsm_kernel.kernel(Required = (Kernel == 'jit'))
+    if Compiled is not None:
+        # the same recursion compiled (see dsm_kernel), run up to one checkpoint year at a time
+        From = First if Resume is None else Start
+        IntensityT = np.ascontiguousarray(np.swapaxes(Intensity, 1, 2), dtype=float) # by k & age-cohort, for the loops over age-cohorts
+        for Year in sorted(set([Year for Year in CheckpointYears if From <= Year < Nt] + [Nt - 1])):
+            Compiled(np.ascontiguousarray(s), np.ascontiguousarray(sf_age, dtype=float), i, Factor, Correction, s_c_m, s_c, o_c, IntensityT,
+                     First, From, Year + 1, -1 if MaxAge is None else MaxAge, First if InitialStock is not None else -1,
+                     NegativeInflowCorrect is True, NonNegativeOutflow is True)
+            if Year in CheckpointYears:
+                checkpoint(Year)
+            From = Year + 1
+    else:
+        for m in range(First if Resume is None else Start, Nt):  # for all years m
+            # 1) Stock of previous age-cohorts at the end of year m, and their outflow during year m (only the age-cohorts of the band, with MaxAge):
+            Lo    = 0 if MaxAge is None else max(m - MaxAge, 0)
+            Band  = slice(Lo, Nt if MaxAge is None else m + 1)
+            s_c_prev = s_c_m
+            sf_m  = sf_year(m)
+            s_c_m = np.zeros((Nn,Nt))
+            s_c_m[:,Band] = i[:,Band] * sf_m[:,Band] * Factor[:,Band]
+            o_c_m = np.zeros((Nn,Nt))
+            if m > 0:
+                o_c_m[:,Lo:m] = s_c_prev[:,Lo:m] - s_c_m[:,Lo:m]
+            if m == First and InitialStock is not None:
+                # the year of the initial stock: no mass balance, only the outflow of the last historic age-cohort during its first year
+                o_c_m[:,m] = i[:,m] * (1 - sf_m[:,m])
+            else:
+                # 2) Determine inflow from mass balance:
+                InflowTest = s[:,m] - s_c_m[:,Band].sum(axis=1)
+                Negative = np.zeros(Nn, dtype=bool)
+                if NegativeInflowCorrect is True and m > 0:
+                    Negative = InflowTest < 0
+                # 2a) Correct remaining stock in series where inflow would be negative:
+                if Negative.any():
+                    StockLeft = s_c_m[Negative,Band].sum(axis=1)
+                    Delta_percent = np.zeros(StockLeft.shape) # stays 0 where the stock in this year is already zero
+                    np.divide(-1 * InflowTest[Negative], StockLeft, out=Delta_percent, where=StockLeft != 0)
+                    o_c_m[Negative,Band] = o_c_m[Negative,Band] + s_c_m[Negative,Band] * Delta_percent[:,np.newaxis] # increase outflow according to the lost fraction of the stock
+                    s_c_m[Negative,Band] = s_c_m[Negative,Band] * (1 - Delta_percent[:,np.newaxis])
+                    Factor[Negative,Lo:m] = Factor[Negative,Lo:m] * (1 - Delta_percent[:,np.newaxis]) # shrink stock from previous age-cohorts in future years as well
+                    Correction[Negative,m] = 1 - Delta_percent
+                # 3) Add new inflow to stock (inflow stays 0 for corrected series and where sf[m,m] = 0)
+                Regular = np.logical_and(~Negative, sf_m[:,m] != 0)
+                i[Regular,m] = InflowTest[Regular] / sf_m[Regular,m] # allow for outflow during first year by rescaling with 1/sf[m,m]
+                s_c_m[:,m]   = i[:,m] * sf_m[:,m]
+                o_c_m[:,m]   = i[:,m] * (1 - sf_m[:,m])
+            if NonNegativeOutflow is True:
+                o_c_m[o_c_m < 0] = 0
+            # 4) Store year m (by age, with MaxAge), or contract it with the intensity:
+            if Intensity is None and MaxAge is None:
+                s_c[:,m-First,:] = s_c_m
+                o_c[:,m-First,:] = o_c_m
+            elif Intensity is None:
+                s_c[:,m-First,0:m+1-Lo] = s_c_m[:,Band][:,::-1]
+                o_c[:,m-First,0:m+1-Lo] = o_c_m[:,Band][:,::-1]
+            else:
+                s_c[:,m-First,:] = np.einsum('nc,nck->nk', s_c_m[:,Band], Intensity[:,Band,:])
+                o_c[:,m-First,:] = np.einsum('nc,nck->nk', o_c_m[:,Band], Intensity[:,Band,:])
+            # 5) Keep the state of the recursion at the end of a checkpoint year:
+            if m in CheckpointYears:
+                checkpoint(m)
+
+    Results = (s_c, o_c, i) + ((Correction,) if ReturnCorrection is True else ())
+    if len(CheckpointYears) > 0:
+        return Results + (Checkpoints,)
+    return Results
+
+
+def compute_stock_driven_cohorts_batch(t, i, lt, Correction = None, NonNegativeOutflow = False, Intensity = None, FirstYear = 0, MaxAge = None):
+    """ Stock and outflow by cohort of several series, rebuilt from the inflow i[n,t] and the negative inflow corrections Correction[n,t]
+    of compute_stock_driven_model_batch (with ReturnCorrection = True), without the year-by-year mass balance.
+
+    The stock of age-cohort c in year m is the surviving inflow, shrunk by all corrections after year c:
+      s_c[n,m,c] = i[n,c] * sf[n,m,c] * prod_{c < m' <= m} Correction[n,m']
+    and the outflow is the decrease of the stock of each age-cohort (and the outflow during the first year for the new cohort).
+    The lifetime lt, NonNegativeOutflow & Intensity are the same as in compute_stock_driven_model_batch, so are the results (up to rounding).
+    All years are computed at once, so split large batches of series into chunks to limit the memory use (several [n,t,t] tables).
+    With FirstYear > 0, only the years FirstYear ... len(t)-1 are rebuilt (the year axis of the results starts at FirstYear),
+    e.g. the years from the initial stock of compute_stock_driven_model_batch (FirstYear = SwitchTime-2).
+    With MaxAge, the results are those of compute_stock_driven_model_batch with the same MaxAge (banded tables), see compute_stock_driven_cohorts_band.
+    """
+    if MaxAge is not None:
+        return compute_stock_driven_cohorts_band(t, i, lt, MaxAge, Correction = Correction, NonNegativeOutflow = NonNegativeOutflow, Intensity = Intensity, FirstYear = FirstYear)
+    i  = np.asarray(i, dtype=float)
+    Nn = i.shape[0] # No of series
+    Nt = len(t)     # No of years
+    if FirstYear == 0:
+        sf = compute_sf_batch(t, lt, Nn)
+    else:
+        # the sf of the years from FirstYear-1 (for the outflow of year FirstYear) only, from the sf by age if possible
+        Years  = np.arange(FirstYear-1, Nt)
+        sf_age = compute_sf_age_batch(t, lt, Nn)
+        if sf_age is None:
+            sf = compute_sf_batch(t, lt, Nn)[:,FirstYear-1:,:]
+        else:
+            sf = sf_age[:,np.maximum(np.subtract.outer(Years, np.arange(0,Nt)), 0)]
+    Rows = sf.shape[1] # No of years rebuilt (incl. the year before FirstYear)
+    Shift = Nt - Rows  # the first row is year Shift
+
+    if Correction is None:
+        s_c = i[:,np.newaxis,:] * sf
+    else:
+        # the correction of year m' applies to all age-cohorts c < m', cumulated over the years up to m
+        Correction = np.asarray(Correction, dtype=float)
+        Older = np.tri(Nt, Nt, -1, dtype=bool)[Shift:,:] # [m',c]: c < m'
+        s_c = i[:,np.newaxis,:] * sf * np.cumprod(np.where(Older, Correction[:,Shift:,np.newaxis], 1.0), axis=1)
+        if Shift > 0:
+            # the corrections of the years before the first row: the product over c < m' < Shift, by age-cohort c
+            Before = np.cumprod(Correction[:,Shift-1:0:-1], axis=1)[:,::-1] # [n,c]: product over m' = c+1 ... Shift-1, for c = 0 ... Shift-2
+            s_c[:,:,0:Shift-1] = s_c[:,:,0:Shift-1] * Before[:,np.newaxis,:]
+    s_c = s_c * np.tri(Nt, Nt, dtype=bool)[Shift:,:] if Shift > 0 else np.tril(s_c) # no stock of future age-cohorts
+
+    o_c = np.zeros((Nn,Rows,Nt))
+    o_c[:,1:,:] = s_c[:,0:Rows-1,:] - s_c[:,1:,:]
+    Diagonal = np.arange(Shift,Nt)
+    o_c[:,Diagonal-Shift,Diagonal] = i[:,Shift:] * (1 - sf[:,Diagonal-Shift,Diagonal]) # outflow during the first year
+    if FirstYear > 0:
+        s_c, o_c = s_c[:,1:,:], o_c[:,1:,:] # without the year before FirstYear
+    if NonNegativeOutflow is True:
+        o_c[o_c < 0] = 0
+
+    if Intensity is None:
+        return s_c, o_c
+    return np.matmul(s_c, Intensity), np.matmul(o_c, Intensity)
+
+
+def compute_stock_driven_cohorts_band(t, i, lt, MaxAge, Correction = None, NonNegativeOutflow = False, Intensity = None, FirstYear = 0):
+    """ Banded version of compute_stock_driven_cohorts_batch, for the lifetime distribution cut off at MaxAge (see compute_stock_driven_model_batch):
+    the stock & outflow by age a = 0 ... MaxAge, s_c[n,t,a] & o_c[n,t,a] (the age-cohort of age a in year t is t-a), so the tables take
+    O(t x MaxAge) instead of O(t x t). With Intensity[n,c,k], the contracted s_k[n,t,k] & o_k[n,t,k] are returned, as compute_stock_driven_cohorts_batch.
+    The corrections of each age-cohort are cumulated by age, so the results equal those of the full tables up to rounding.
+    """
+    i  = np.asarray(i, dtype=float)
+    Nn = i.shape[0] # No of series
+    Nt = len(t)     # No of years
+    Width = min(MaxAge + 1, Nt) # ages 0 ... MaxAge: the stock is 0 at age MaxAge, its outflow is the stock left
+    Shift = FirstYear - 1 if FirstYear > 0 else 0 # first year rebuilt (the year before FirstYear, for its outflow)
+    Years = np.arange(Shift, Nt)
+    Valid = np.logical_and(np.subtract.outer(Years, np.arange(0,Width)) >= 0, np.arange(0,Width) < MaxAge) # [m,a]: an age-cohort of age a in year m, within the band
+    sf_age = compute_sf_age_batch(t, lt, Nn)
+    if sf_age is None:
+        sf = compute_sf_batch(t, lt, Nn)[:,Years[:,np.newaxis],np.maximum(np.subtract.outer(Years, np.arange(0,Width)), 0)]
+    else:
+        sf = sf_age[:,np.newaxis,0:Width]
+    sf = np.where(Valid, sf, 0)
+
+    s_c = compute_lagged_view(i, Width, Shift) * sf
+    if Correction is not None:
+        # the corrections of the years after the age-cohort, up to year m: the product of Correction[n,m'] over m-a < m' <= m, for age a
+        Cumulative = np.cumprod(compute_lagged_view(Correction, Width, Shift), axis=2) # product over m-a <= m' <= m
+        s_c[:,:,1:] = s_c[:,:,1:] * Cumulative[:,:,0:Width-1]
+
+    o_c = np.zeros(s_c.shape)
+    o_c[:,1:,1:] = s_c[:,0:-1,0:-1] - s_c[:,1:,1:] # the decrease of the stock of each age-cohort, a year older
+    o_c[:,:,0]   = i[:,Years] * (1 - sf[:,:,0])     # outflow during the first year
+    if FirstYear > 0:
+        s_c, o_c = s_c[:,1:,:], o_c[:,1:,:] # without the year before FirstYear
+    if NonNegativeOutflow is True:
+        o_c[o_c < 0] = 0
+
+    if Intensity is None:
+        return s_c, o_c
+    # contract each age with the intensity of its age-cohort (the stock & outflow are 0 outside the band), material by material (faster than at once)
+    Intensity_a = compute_lagged_view(Intensity, Width, FirstYear)
+    s_k = np.stack([np.einsum('nma,nma->nm', s_c, Intensity_a[:,:,:,k]) for k in range(0,Intensity_a.shape[3])], axis=2)
+    o_k = np.stack([np.einsum('nma,nma->nm', o_c, Intensity_a[:,:,:,k]) for k in range(0,Intensity_a.shape[3])], axis=2)
+    return s_k, o_k
+
+
+def compute_sf_by_age(Type, Age, Mean=None, StdDev=None, Shape=None, Scale=None):
+    """
+    Survival function of the lifetime distribution Type, evaluated for an array of ages.
+    The lifetime parameters can be scalars or arrays that broadcast against Age, e.g., one value per age-cohort (column) of a year-by-cohort table of ages.
+    For lifetimes 0 the sf is also 0, meaning that the age-cohort leaves during the same year of the inflow.
+    Values for negative ages are not set to zero here, the caller only uses the lower triangle of the year-by-cohort table.
+    """
+    if Type == 'Fixed': # fixed lifetime, age-cohort leaves the stock in the model year when the age specified as 'Mean' is reached.
+        return np.multiply(1, (Age < Mean)).astype(float) # converts bool to 0/1
+        # Example: if Lt is 3.5 years fixed, product will still be there after 0, 1, 2, and 3 years, gone after 4 years.
+
+    if Type == 'Weibull': # Weibull distribution with standard definition of scale and shape parameters
+        Valid = Shape != 0 # For products with lifetime of 0, sf == 0
+        sf = scipy.stats.weibull_min.sf(Age, c=np.where(Valid, Shape, 1), loc = 0, scale=np.where(Valid, Scale, 1))
+        return np.where(Valid, sf, 0)
+
+    Valid = Mean != 0 # For products with lifetime of 0, sf == 0
+    Mean   = np.where(Valid, Mean, 1)
+    StdDev = np.where(Valid, StdDev, 1)
+    if Type == 'Normal': # normally distributed lifetime with mean and standard deviation.
+        sf = scipy.stats.norm.sf(Age, loc=Mean, scale=StdDev)
+        # NOTE: As normal distributions have nonzero pdf for negative ages, which are physically impossible, 
+        # these outflow contributions can either be ignored (violates the mass balance) or
+        # allocated to the zeroth year of residence, the latter being implemented in the method compute compute_o_c_from_s_c.
+        # As alternative, use lognormal or folded normal distribution options.
+    elif Type == 'FoldedNormal': # Folded normal distribution, cf. https://en.wikipedia.org/wiki/Folded_normal_distribution
+        sf = scipy.stats.foldnorm.sf(Age, Mean/StdDev, 0, scale=StdDev)
+        # NOTE: call this option with the parameters of the normal distribution mu and sigma of curve BEFORE folding,
+        # curve after folding will have different mu and sigma.
+    elif Type == 'LogNormal': # lognormal distribution
+        # Here, the mean and stddev of the lognormal curve, 
+        # not those of the underlying normal distribution, need to be specified! conversion of parameters done here:
+        # calculate parameter mu    of underlying normal distribution:
+        LT_LN = np.log(Mean / np.sqrt(1 + Mean * Mean / (StdDev * StdDev))) 
+        # calculate parameter sigma of underlying normal distribution:
+        SG_LN = np.sqrt(np.log(1 + Mean * Mean / (StdDev * StdDev)))
+        # compute survial function
+        sf = scipy.stats.lognorm.sf(Age, s=SG_LN, loc = 0, scale=np.exp(LT_LN)) 
+        # values chosen according to description on
+        # https://docs.scipy.org/doc/scipy-0.13.0/reference/generated/scipy.stats.lognorm.html
+        # Same result as EXCEL function "=LOGNORM.VERT(x;LT_LN;SG_LN;TRUE)"
+    else:
+        return np.zeros(np.shape(Age))
+    return np.where(Valid, sf, 0)
+
+
+
 
 #
 #
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Floorspace for BUMA
+
+Residential floorspace (m2) by area (rural & urban), building type, region & year.
+The population of each area is divided over the building types (housing type shares) and multiplied with our OWN average m2/cap by building type.
+The result is then corrected, so that the total m2 per capita by area matches the IMAGE floorspace data, while keeping our own distinction between building types.
+All areas, building types, regions & years are calculated at once, so adding a building type or area only adds an index value.
+
+Array layout:
+    Population[r,y]          total population by region r & year y
+    AreaShare[a,r,y]         share of the population living in area a (e.g. rural & urban)
+    HousingShare[a,g,r]      share of the NUMBER OF PEOPLE in area a living in building type g
+    M2Cap[a,g,r]             OWN average m2/cap by area, building type & region
+    FloorspaceCap[a,r,y]     IMAGE average m2/cap by area
+
+dependencies:
+    numpy >= 1.9
+"""
+
+import numpy as np
+
+
+def floorspace_by_type(Population, AreaShare, HousingShare, M2Cap, FloorspaceCap):
+    """
+    Returns:
+      M2[a,g,r,y]         floorspace by area, building type, region & year (using the correction factor, to comply with IMAGE avg m2/cap)
+      People[a,r,y]       population by area
+      Factor[a,r,y]       correction factor of the OWN m2/cap to the IMAGE m2/cap
+    The housing type shares are given as a percentage of the total (all areas), so they are first adjusted to add up to 1 within each area.
+    """
+    HousingShare = np.asarray(HousingShare, dtype=float)
+    HousingShare = HousingShare / HousingShare.sum(axis=1, keepdims=True)
+    People     = np.asarray(AreaShare, dtype=float) * np.asarray(Population, dtype=float)[np.newaxis,:,:]
+    # m2 by building type (= nr. of people * OWN avg m2, so not based on IMAGE)
+    Unadjusted = np.asarray(M2Cap, dtype=float)[:,:,:,np.newaxis] * (HousingShare[:,:,:,np.newaxis] * People[:,np.newaxis,:,:])
+    # average square meter per person implied by our OWN data, & the factor to correct it to the IMAGE data
+    AvgM2Cap   = Unadjusted.sum(axis=1) / People
+    Factor     = np.asarray(FloorspaceCap, dtype=float) / AvgM2Cap
+    M2         = Unadjusted * Factor[:,np.newaxis,:,:]
+    return M2, People, Factor
+
+
+# The end.
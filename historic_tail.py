@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Historic tail for BUMA
+
+The IMAGE data starts in 1971, but the stock model needs the history of the building stock, so a historic tail is added before the data.
+From the start of the tail (e.g. 1820) up to the data, each variable is extrapolated from its value in an anchor year
+(e.g. the first data year) with a given trend, bounded by a minimum and/or maximum value.
+Before the start of the tail, the values increase linearly from zero over a ramp period (e.g. 100 years, so 1720 = 0),
+to avoid a full model setup in the first year (all required stock gets built in year 1).
+
+All regions (and variables) are calculated at once, as closed-form array expressions.
+
+dependencies:
+    numpy >= 1.9
+"""
+
+import numpy as np
+
+
+def trend_factor(Years, AnchorYear, Growth):
+    """
+    Multiplier Growth**(AnchorYear - year) of the anchor value in Years[h], for a constant annual Growth by region (shape [r])
+    or the same for all regions (scalar, the result has shape [h,1] then).
+    """
+    return np.asarray(Growth, dtype=float) ** (AnchorYear - np.asarray(Years)).reshape((-1,) + (1,) * max(np.ndim(Growth), 1))
+
+
+def build_tail(Years, Data, Anchor, Factor, TailStart = 1820, RampLength = 100, Lower = None, Upper = None, out = None):
+    """
+    Full time series [y,...] for all Years of the model period (e.g. 1721-2050), with the historic tail before the Data.
+
+      Data[d,...]      the data for the last d years of the model period (e.g. 1971-2050)
+      Anchor[...]      the value from which the tail is extrapolated (e.g. the value in the first data year, by region)
+      Factor[h,...]    the multiplier of the Anchor in each year h before the data (e.g. 1721-1970), see trend_factor.
+                       Only the years from TailStart are used.
+      TailStart        first year of the extrapolated tail, before this year the linear ramp is used
+      RampLength       number of years over which the ramp increases from zero to the value in TailStart,
+                       if TailStart - RampLength is before the model period, the ramp is cut off at the first year
+      Lower, Upper     bounds of the extrapolated tail (e.g. the minimum floorspace/cap in the data)
+      out              optional, preallocated array [y,...] to write the result into
+    """
+    Years = np.asarray(Years)
+    Data  = np.asarray(Data, dtype=float)
+    Nh    = len(Years) - Data.shape[0]   # No of years before the data
+    Start = int(np.clip(TailStart - Years[0], 0, Nh)) # position of TailStart
+    if out is None:
+        out = np.zeros((len(Years),) + Data.shape[1:])
+
+    # extrapolated tail, bounded by the MINimum and/or MAXimum values
+    Tail = np.asarray(Anchor, dtype=float) * np.asarray(Factor, dtype=float)[Start:Nh]
+    if Lower is not None:
+        Tail = np.maximum(Lower, Tail)
+    if Upper is not None:
+        Tail = np.minimum(Upper, Tail)
+    out[Start:Nh] = Tail
+    out[Nh:]      = Data
+
+    # linear ramp to the TailStart value, MAX(0,...) because of floating point deviations, leading to negative stock in some cases
+    if Start > 0:
+        First = out[Start]
+        Distance = (TailStart - Years[0:Start]).reshape((-1,) + (1,) * First.ndim)
+        out[0:Start] = np.maximum(0.0, First - (First/RampLength) * Distance)
+    return out
+
+
+# The end.
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Initial stock for BUMA
+
+The historic tail (1721-1970) & the linear ramp before tail_start are only there to give the stock a plausible age structure by 1970,
+but they take about three quarters of the years of the stock model (and of its year x age-cohort tables).
+Instead, the stock model can start from the age structure of the stock at the end of the seed year (1970) by building type & region,
+and only solve the years after it (see compute_stock_driven_model_batch with InitialStock, in dynamic_stock_model):
+    - spinup:   the age structure of a stock model run over the historic years only (up to & including the seed year), the same as that of the
+                full run (up to rounding), so the seeded model gives the results of the full run; computed once & kept as a stage of the model
+    - analytic: the age structure of a stock that grows at a constant rate g (the average growth over the Window years before the seed year)
+                with the lifetime distribution of the series: the stock of age a is proportional to sf(a) / g^a, scaled to the stock in the seed year
+                (no stock model for the historic years at all)
+The accuracy of a seeded run is measured against the full run by accuracy_report (the differences in the years after the seed year).
+
+Usage (from the model folder), to compare the seeded & full runs (time & accuracy, written to output/initial_stock_accuracy.csv):
+    python initial_stock.py [--method analytic spinup] [--seed-year 1970]
+
+Array layout:
+    Stock[n,t]               stock of series n (building type x region) in year t
+    InitialStock[n,c]        stock of series n by age-cohort c (c = 0 ... seed year) at the end of the seed year
+
+dependencies:
+    numpy >= 1.9
+    pandas
+    dynamic_stock_model (ODYM, with the batched stock driven model)
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from dynamic_stock_model import compute_stock_driven_model_batch, compute_stock_driven_cohorts_batch, compute_sf_age_batch
+
+methods = ['spinup', 'analytic']
+
+
+def spinup_initial_stock(t, Stock, lt, SwitchTime, NegativeInflowCorrect = True):
+    """ Stock by age-cohort InitialStock[n,c] at the end of year SwitchTime-2, from the stock model over the years 0 ... SwitchTime-2 only. """
+    Stock = np.asarray(Stock, dtype=float)
+    Nn, Nh = Stock.shape[0], SwitchTime - 1 # No of series, No of historic years (up to & including the year of the initial stock)
+    lt_h = {ThisKey: (Value if ThisKey == 'Type' or np.ndim(Value) < 2 else np.asarray(Value)[:,0:Nh]) for ThisKey, Value in lt.items()}
+    s_k, o_k, i, Correction = compute_stock_driven_model_batch(t[0:Nh], Stock[:,0:Nh], lt_h, NegativeInflowCorrect = NegativeInflowCorrect,
+                                                               Intensity = np.ones((Nn, Nh, 1)), ReturnCorrection = True)
+    s_c, o_c = compute_stock_driven_cohorts_batch(t[0:Nh], i, lt_h, Correction = Correction, FirstYear = Nh - 1) # the last year only
+    return s_c[:,0,:]
+
+
+def analytic_initial_stock(t, Stock, lt, SwitchTime, Window = 30):
+    """ Stock by age-cohort InitialStock[n,c] at the end of year SwitchTime-2, for a constant growth of the stock over the Window years before it. """
+    Stock = np.asarray(Stock, dtype=float)
+    Nn, Nh = Stock.shape[0], SwitchTime - 1
+    sf_age = compute_sf_age_batch(t[0:Nh], lt, Nn) # sf by age 0 ... Nh-1
+    if sf_age is None:
+        raise ValueError('the analytic initial stock needs the same lifetime for all age-cohorts of a series')
+    Now, Before = Stock[:,Nh-1], Stock[:,Nh-1-Window]
+    Growth = np.ones(Nn)
+    np.divide(Now, Before, out=Growth, where=np.logical_and(Now > 0, Before > 0))
+    Growth = Growth ** (1 / Window) # average growth factor by year
+    Weight = sf_age * Growth[:,np.newaxis] ** -np.arange(0,Nh)[np.newaxis,:] # by age: the inflow of a years ago (relative to now) that survives
+    Total  = Weight.sum(axis=1)
+    Share  = np.zeros((Nn,Nh))
+    np.divide(Weight, Total[:,np.newaxis], out=Share, where=Total[:,np.newaxis] > 0)
+    return (Now[:,np.newaxis] * Share)[:,::-1] # from age to age-cohort: age a is age-cohort Nh-1-a
+
+
+def seed_stock(Method, t, Stock, lt, SwitchTime, Window = 30):
+    """ InitialStock[n,c] by Method ('spinup' or 'analytic'), see the module description. """
+    if Method == 'spinup':
+        return spinup_initial_stock(t, Stock, lt, SwitchTime)
+    if Method == 'analytic':
+        return analytic_initial_stock(t, Stock, lt, SwitchTime, Window)
+    raise ValueError('unknown initial stock method: ' + str(Method))
+
+
+def accuracy_report(Full, Seeded, FirstYear, Years = None):
+    """
+    Differences between the results of a seeded run & the full run, in the years after the initial stock.
+    Full & Seeded are dictionaries of the same results: [b,r,t] (floorspace) or [b,r,t,k] (materials) arrays, the year axis of Full starts at year 0,
+    that of Seeded at FirstYear (the year of the initial stock). Years are the labels of the year axis of Full (for the columns, default 0 ... T-1).
+    Returns a dataframe by result (& material k) with:
+      error            sum of the absolute differences / sum of the absolute values of the full run (all series & years)
+      max_error        largest absolute difference of a series in a year, relative to the largest value of that series (the series with values only)
+      world_error      largest relative difference of the world total (the sum over building types & regions) in a year
+      world_error_<y>  relative difference of the world total in the last year y
+    """
+    Rows = []
+    for Name in Full.keys():
+        Last = np.shape(Full[Name])[2] - 1 if Years is None else Years[-1] # label of the last year
+        F = np.asarray(Full[Name], dtype=float)
+        S = np.asarray(Seeded[Name], dtype=float)
+        F = F.reshape(F.shape[0:3] + (-1,))[:,:,FirstYear+1:,:] # [b,r,t,k], the years after the initial stock
+        S = S.reshape(S.shape[0:3] + (-1,))[:,:,1:,:]
+        for k in range(0, F.shape[3]):
+            Difference = np.abs(S[:,:,:,k] - F[:,:,:,k])
+            Scale = np.abs(F[:,:,:,k]).max(axis=2, keepdims=True)
+            World_F, World_S = F[:,:,:,k].sum(axis=(0,1)), S[:,:,:,k].sum(axis=(0,1))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                World = np.where(World_F != 0, np.abs(World_S - World_F) / np.abs(World_F), 0)
+                Row = {'result': Name, 'k': k,
+                       'error': Difference.sum() / np.abs(F[:,:,:,k]).sum() if np.abs(F[:,:,:,k]).sum() > 0 else 0.0,
+                       'max_error': float(np.max(np.where(Scale > 0, Difference / Scale, 0))),
+                       'world_error': float(World.max()),
+                       'world_error_' + str(Last): float(World[-1])}
+            Rows.append(Row)
+    return pd.DataFrame(Rows)
+
+
+if __name__ == '__main__':
+    import building_materials as bm
+    parser = argparse.ArgumentParser(description='Time & accuracy of the BUMA stock model started from an initial stock, against the full spin-up from 1721.')
+    parser.add_argument('--method',    nargs='+', default=methods, choices=methods)
+    parser.add_argument('--seed-year', type=int, default=bm.seed_year)
+    parser.add_argument('--window',    type=int, default=bm.seed_window, help='analytic: years of the stock growth before the seed year')
+    arguments = parser.parse_args()
+
+    Runs = {}
+    for Method in [None] + arguments.method:
+        Start = time.perf_counter()
+        stages = bm.run_model(seed_method = Method, seed_year = arguments.seed_year, seed_window = arguments.window, cache_dir = None)
+        Seconds = time.perf_counter() - Start
+        dsm, material = stages.result('dsm'), stages.result('material')
+        Runs[Method] = {'first_year': dsm['first_year'],
+                        'results': {'m2_stock': dsm['m2_stock_array'][:,:,dsm['first_year']:], 'm2_inflow': dsm['m2_i'][:,:,dsm['first_year']:], 'm2_outflow': dsm['m2_o'],
+                                    'kg_stock': material['kg_s'], 'kg_inflow': material['kg_i'], 'kg_outflow': material['kg_o']}}
+        print(str(Method or 'full spin-up') + ': ' + str(round(Seconds, 2)) + ' s (stages computed: ' + ', '.join(stages.Computed) + ')')
+
+    Tables = []
+    for Method in arguments.method:
+        Table = accuracy_report(Runs[None]['results'], Runs[Method]['results'], Runs[Method]['first_year'], Years = np.arange(1721, bm.end_year + 1))
+        Table['result'] = [Name + ('_' + bm.material_names[k] if Name.startswith('kg') else '') for Name, k in zip(Table['result'], Table['k'])]
+        Table.insert(0, 'method', Method)
+        Tables.append(Table.drop(columns='k'))
+    Report = pd.concat(Tables, ignore_index=True)
+    print(Report.to_string(index=False))
+    os.makedirs('output', exist_ok=True)
+    Report.to_csv(os.path.join('output', 'initial_stock_accuracy.csv'), index=False)
+    sys.exit(0)
+
+
+# The end.
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Binary input store for BUMA
+
+The csv-files of the model (IMAGE data, material & lifetime databases, fitted parameters) compiled to typed numpy arrays (.npy files) in one folder,
+so that they are opened as memory maps instead of being parsed again by every run (or every worker of a parallel run):
+    - each csv-file is stored as one array by column type: int64 & float64 blocks (rows x columns) & the text columns (fixed width unicode)
+    - a JSON description by file holds the column names, types & positions, the number of rows & the sha256 hash of the csv-file
+    - the index of the store (index.json) holds the size, modification time & hash of each csv-file, a csv-file of which the size or time
+      changed is hashed again, and compiled again if its content changed (so the store never serves an outdated file)
+    - the files of the store carry the version of the store format (StoreVersion), files of another version are compiled again
+The arrays are opened copy-on-write (mmap_mode 'c'): the pages are shared between processes, & changes stay in memory (the files are never modified).
+InputStore.read_csv returns the same dataframe as pandas.read_csv (for the index_col given); a float or int block without other columns is used
+without copying.
+
+Usage (from the model folder), to compile all csv-files of the model folders at once:
+    python input_store.py [--store store]
+
+Array layout:
+    <name>_<hash>.float.npy  [row, float column]
+    <name>_<hash>.int.npy    [row, int column]
+    <name>_<hash>.text<j>.npy [row]   text column j
+
+dependencies:
+    numpy >= 1.9
+    pandas
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+
+StoreVersion = 1
+folders = ['files_DB', 'files_IMAGE', 'files_commercial', 'files_initial_stock', 'files_lifetimes']
+
+
+def file_hash(FileName):
+    Hash = hashlib.sha256()
+    with open(FileName, 'rb') as File:
+        Hash.update(File.read())
+    return Hash.hexdigest()
+
+
+class InputStore(object):
+
+    """ Typed, memory-mapped copies of csv-files in StoreDir, compiled on first use & whenever a csv-file changes.
+
+    Set Enabled to False (or StoreDir to None) to read the csv-files with pandas.read_csv.
+    """
+
+    def __init__(self, StoreDir = 'store', Enabled = True):
+        self.StoreDir = StoreDir
+        self.Enabled  = Enabled and StoreDir is not None
+        self.Index    = None # csv-file: size, time & hash, loaded on first use
+
+    def name(self, FileName):
+        """ Name of the files of a csv-file in the store (without hash & extension), e.g. files_IMAGE_pop """
+        return re.sub(r'[^0-9A-Za-z]+', '_', os.path.splitext(os.path.normpath(FileName))[0]).strip('_')
+
+    def source_hash(self, FileName):
+        """ Hash of the csv-file, from the index if its size & modification time did not change. """
+        if self.Index is None:
+            try:
+                with open(os.path.join(self.StoreDir, 'index.json')) as File:
+                    self.Index = json.load(File)
+            except (OSError, ValueError):
+                self.Index = {}
+        Status = os.stat(FileName)
+        Known = self.Index.get(os.path.normpath(FileName))
+        if Known is not None and Known['size'] == Status.st_size and Known['mtime_ns'] == Status.st_mtime_ns:
+            return Known['sha256']
+        Hash = file_hash(FileName)
+        self.Index[os.path.normpath(FileName)] = {'size': Status.st_size, 'mtime_ns': Status.st_mtime_ns, 'sha256': Hash}
+        self.write_json(os.path.join(self.StoreDir, 'index.json'), self.Index)
+        return Hash
+
+    def write_json(self, FileName, Value):
+        os.makedirs(self.StoreDir, exist_ok=True)
+        TempFile = FileName + '.' + str(os.getpid()) + '.tmp'
+        with open(TempFile, 'w') as File:
+            json.dump(Value, File, indent=1)
+        os.replace(TempFile, FileName) # no partially written files, e.g. with several runs at once
+
+    def compile(self, FileName, Hash = None):
+        """ Parse the csv-file (pandas.read_csv) & store its columns as typed arrays. Returns the description of the stored table. """
+        Hash  = Hash or self.source_hash(FileName)
+        Base  = os.path.join(self.StoreDir, self.name(FileName) + '_' + Hash[0:16])
+        Table = pd.read_csv(FileName)
+        Description = {'version': StoreVersion, 'source': os.path.normpath(FileName), 'sha256': Hash, 'rows': len(Table),
+                       'columns': [str(Column) for Column in Table.columns], 'kinds': [], 'positions': []}
+        Blocks = {'float': [], 'int': []}
+        Texts = []
+        for Column in Table.columns:
+            Values = Table[Column]
+            if Values.dtype.kind == 'f':
+                Kind = 'float'
+            elif Values.dtype.kind in 'iub':
+                Kind = 'int'
+            else:
+                Kind = 'text'
+            if Kind == 'text':
+                Description['kinds'].append('text')
+                Description['positions'].append(len(Texts))
+                Texts.append((np.array(Values.fillna('').astype(str), dtype=str), Values.isna().to_numpy()))
+            else:
+                Description['kinds'].append(Kind)
+                Description['positions'].append(len(Blocks[Kind]))
+                Blocks[Kind].append(Values.to_numpy(dtype=np.float64 if Kind == 'float' else np.int64))
+        os.makedirs(self.StoreDir, exist_ok=True)
+        def save(Suffix, Array):
+            TempFile = Base + Suffix + '.' + str(os.getpid()) + '.tmp.npy'
+            np.save(TempFile, Array)
+            os.replace(TempFile, Base + Suffix + '.npy')
+        for Kind in ['float', 'int']:
+            if Blocks[Kind]:
+                save('.' + Kind, np.column_stack(Blocks[Kind]))
+        for j, (Text, Missing) in enumerate(Texts):
+            save('.text' + str(j), Text)
+            Description.setdefault('missing', []).append(np.flatnonzero(Missing).tolist())
+        self.write_json(Base + '.json', Description) # written last: the arrays of a table are complete when its description exists
+        # remove earlier versions of the csv-file (these may still be open elsewhere, e.g. on Windows, then they are left for the next time)
+        Earlier = re.compile(re.escape(self.name(FileName)) + r'_[0-9a-f]{16}\.')
+        for Other in os.listdir(self.StoreDir):
+            if Earlier.match(Other) and not Other.startswith(os.path.basename(Base) + '.'):
+                try:
+                    os.remove(os.path.join(self.StoreDir, Other))
+                except OSError:
+                    pass
+        return Description
+
+    def table(self, FileName):
+        """ Description & (memory-mapped) arrays of a csv-file, compiled first if it is not in the store (or changed). """
+        Hash = self.source_hash(FileName)
+        Base = os.path.join(self.StoreDir, self.name(FileName) + '_' + Hash[0:16])
+        try:
+            with open(Base + '.json') as File:
+                Description = json.load(File)
+            if Description['version'] != StoreVersion or Description['sha256'] != Hash:
+                raise ValueError('outdated')
+        except (OSError, ValueError, KeyError):
+            Description = self.compile(FileName, Hash)
+        Arrays = {}
+        for Kind in ['float', 'int']:
+            if Kind in Description['kinds']:
+                Arrays[Kind] = np.load(Base + '.' + Kind + '.npy', mmap_mode='c')
+        for j in range(0, Description['kinds'].count('text')):
+            Arrays['text' + str(j)] = np.load(Base + '.text' + str(j) + '.npy', mmap_mode='c')
+        return Description, Arrays
+
+    def read_csv(self, FileName, index_col = None):
+        """ The csv-file as a dataframe, as pandas.read_csv(FileName, index_col = index_col), from the store. """
+        if self.Enabled is not True:
+            return pd.read_csv(FileName, index_col = index_col)
+        Description, Arrays = self.table(FileName)
+
+        def column(j):
+            Kind, Position = Description['kinds'][j], Description['positions'][j]
+            if Kind != 'text':
+                return Arrays[Kind][:,Position]
+            Values = Arrays['text' + str(Position)].astype(object)
+            Values[Description['missing'][Position]] = np.nan
+            return Values
+
+        Names = Description['columns']
+        Index = [] if index_col is None else list(np.atleast_1d(index_col))
+        Data  = [j for j in range(0, len(Names)) if j not in Index]
+        Kinds = set(Description['kinds'][j] for j in Data)
+        IndexNames = [None if re.match(r'^Unnamed: \d+$', Names[j]) else Names[j] for j in Index]    # as pandas: no name for an index column without header
+        if len(Index) == 0:
+            RowIndex = pd.RangeIndex(Description['rows'])
+        elif len(Index) == 1:
+            RowIndex = pd.Index(column(Index[0]), name=IndexNames[0])
+        else:
+            RowIndex = pd.MultiIndex.from_arrays([column(j) for j in Index], names=IndexNames)
+        Positions = [Description['positions'][j] for j in Data]
+        if len(Kinds) == 1 and 'text' not in Kinds and Positions == list(range(0, Arrays[Kinds.pop()].shape[1])):
+            # all data columns are one block: the dataframe uses the memory map itself
+            Block = Arrays[Description['kinds'][Data[0]]]
+            return pd.DataFrame(Block, index=RowIndex, columns=[Names[j] for j in Data], copy=False)
+        return pd.DataFrame({Names[j]: column(j) for j in Data}, index=RowIndex, columns=[Names[j] for j in Data])
+
+
+def compile_store(StoreDir = 'store', Folders = folders):
+    """ Compile all csv-files in Folders (that are not up to date in the store). Returns the names of the csv-files. """
+    Store = InputStore(StoreDir)
+    Files = sorted(FileName for Folder in Folders for FileName in glob.glob(os.path.join(Folder, '*.csv')))
+    for FileName in Files:
+        Store.table(FileName)
+    return Files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the csv-files of the BUMA model to the binary input store.')
+    parser.add_argument('--store', default='store', help='folder of the input store')
+    arguments = parser.parse_args()
+    for FileName in compile_store(arguments.store):
+        print(FileName)
+    sys.exit(0)
+
+
+# The end.
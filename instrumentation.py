@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Run instrumentation for BUMA
+
+Records where the time & memory of a model run go, by stage of the pipeline (see pipeline.StageCache) and by call of the
+stock model / material engine within the stages (functions decorated with monitored):
+    - wall time & cpu time (s)
+    - peak traced memory (MB, tracemalloc: the peak of the memory allocated by python & numpy within the stage or call, above the level at its start)
+    - the size of the results: shape, dtype & MB of each array or dataframe (also within dictionaries, lists & tuples)
+The records are written as a JSON run report (e.g. output/run_report.json, next to the csv output).
+
+Without a RunMonitor (or with Enabled = False) nothing is recorded: the stages & monitored functions only check that no monitor is active.
+Memory tracing slows down code that allocates many small objects, so it can be switched off separately (TraceMemory = False).
+
+A sampling profiler can be run for one stage only: RunMonitor(ProfileStage = 'dsm', Profiler = ...), with Profiler a function of the stage name
+that returns a context manager (started before & stopped after the stage), e.g. pyinstrument_profiler(folder) for pyinstrument.
+
+dependencies:
+    python >= 3.9 (tracemalloc.reset_peak)
+    numpy >= 1.9
+    pandas
+    pyinstrument (optional, for pyinstrument_profiler)
+"""
+
+import os
+import json
+import time
+import datetime
+import platform
+import functools
+import contextlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+_active = None  # the monitor of the stage that is running, if any (used by the monitored functions)
+
+
+def result_sizes(Result):
+    """ Shape, dtype & size (MB) of the arrays & dataframes in Result, by (nested) key. """
+    Sizes = {}
+    def add(Name, Value):
+        if isinstance(Value, np.ndarray):
+            Sizes[Name] = {'shape': list(Value.shape), 'dtype': Value.dtype.str, 'mb': Value.nbytes / 2**20}
+        elif isinstance(Value, (pd.DataFrame, pd.Series)):
+            Sizes[Name] = {'shape': list(Value.shape), 'dtype': 'frame' if isinstance(Value, pd.DataFrame) else Value.dtype.str,
+                           'mb': float(np.sum(Value.memory_usage(index=True))) / 2**20}
+        elif isinstance(Value, dict):
+            for ThisKey, Item in Value.items():
+                add((Name + '.' if Name else '') + str(ThisKey), Item)
+        elif isinstance(Value, (list, tuple)):
+            for Number, Item in enumerate(Value):
+                add((Name + '.' if Name else '') + str(Number), Item)
+    add('', Result)
+    return Sizes
+
+
+class RunMonitor(object):
+
+    """ Records the wall time, cpu time, peak traced memory & result sizes of the stages (and monitored calls) of a model run.
+
+    Records holds one dictionary by stage or call (in the order in which they were finished), with its name, kind ('stage', 'load' or 'call'),
+    the name of the stage or call it was part of (parent) & the measurements.
+    """
+
+    def __init__(self, Enabled = True, TraceMemory = True, ProfileStage = None, Profiler = None):
+        self.Enabled      = Enabled
+        self.TraceMemory  = TraceMemory
+        self.ProfileStage = ProfileStage
+        self.Profiler     = Profiler
+        self.Records      = []
+        self.Stack        = []   # records in progress (nested)
+        self.Start        = (time.perf_counter(), time.process_time())
+
+    @contextlib.contextmanager
+    def measure(self, Name, Kind = 'stage', TraceMemory = True):
+        """ Context manager that records the block as stage (or call) Name. Yields the record, the caller can add the result sizes to it.
+        TraceMemory = False skips the peak memory of this block (e.g. writing large csv-files, which is much slower with tracemalloc). """
+        global _active
+        if self.Enabled is not True:
+            yield {}
+            return
+        Record = {'name': Name, 'kind': Kind, 'parent': self.Stack[-1]['name'] if self.Stack else None}
+        Tracing = self.TraceMemory and TraceMemory and (tracemalloc.is_tracing() or not self.Stack)
+        if Tracing:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                Record['_started'] = True
+            Current, Peak = tracemalloc.get_traced_memory()
+            for Outer in self.Stack:  # the peak so far belongs to the outer records, before it is reset for this one
+                Outer['_peak'] = max(Outer.get('_peak', 0), Peak)
+            tracemalloc.reset_peak()
+            Record['_base'], Record['_peak'] = Current, Current
+        Profile = self.Profiler(Name) if (self.Profiler is not None and Name == self.ProfileStage and Kind == 'stage') else contextlib.nullcontext()
+        self.Stack.append(Record)
+        Previous, _active = _active, self
+        Start = (time.perf_counter(), time.process_time())
+        try:
+            with Profile:
+                yield Record
+        finally:
+            Record['wall_s'] = time.perf_counter() - Start[0]
+            Record['cpu_s']  = time.process_time() - Start[1]
+            _active = Previous
+            self.Stack.pop()
+            if Tracing:
+                Peak = max(Record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+                Record['peak_mb'] = (Peak - Record.pop('_base')) / 2**20
+                for Outer in self.Stack:
+                    Outer['_peak'] = max(Outer.get('_peak', 0), Peak)
+                if Record.pop('_started', False):
+                    tracemalloc.stop()
+            self.Records.append(Record)
+
+    def sizes(self, Record, Result):
+        """ Add the sizes of the arrays & dataframes in Result to Record (of measure). """
+        if self.Enabled is True:
+            Record['sizes'] = result_sizes(Result)
+        return Result
+
+    def report(self, **Settings):
+        """ The run report: date, platform, settings, total wall & cpu time, & the records. """
+        return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(), 'numpy': np.__version__,
+                'pandas': pd.__version__, 'machine': platform.platform(), 'settings': Settings,
+                'wall_s': time.perf_counter() - self.Start[0], 'cpu_s': time.process_time() - self.Start[1], 'records': self.Records}
+
+    def write(self, FileName, **Settings):
+        """ Write the run report (with the given settings of the run) as JSON. """
+        if self.Enabled is not True:
+            return
+        os.makedirs(os.path.dirname(FileName) or '.', exist_ok=True)
+        with open(FileName + '.tmp', 'w') as File:
+            json.dump(self.report(**Settings), File, indent=1, default=str)
+        os.replace(FileName + '.tmp', FileName)
+
+
+def monitored(Function):
+    """ Decorator: record each call of Function (with the size of its result) when a RunMonitor is active, e.g. within a monitored stage. """
+    @functools.wraps(Function)
+    def wrapper(*args, **kwargs):
+        if _active is None:
+            return Function(*args, **kwargs)
+        with _active.measure(Function.__name__, 'call') as Record:
+            return _active.sizes(Record, Function(*args, **kwargs))
+    return wrapper
+
+
+def pyinstrument_profiler(OutputDir = 'output'):
+    """ Profiler for RunMonitor: the pyinstrument sampling profiler, with the report of stage Name in OutputDir/profile_<Name>.html & .txt """
+    from pyinstrument import Profiler   # optional dependency, only needed when a stage is profiled
+
+    @contextlib.contextmanager
+    def profile(Name):
+        Sampler = Profiler()
+        Sampler.start()
+        try:
+            yield Sampler
+        finally:
+            Sampler.stop()
+            os.makedirs(OutputDir, exist_ok=True)
+            with open(os.path.join(OutputDir, 'profile_' + Name + '.html'), 'w') as File:
+                File.write(Sampler.output_html())
+            with open(os.path.join(OutputDir, 'profile_' + Name + '.txt'), 'w') as File:
+                File.write(Sampler.output_text())
+    return profile
+
+
+# The end.
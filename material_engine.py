@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Material engine for BUMA
+
+Material stock, inflow & outflow for all building types, regions & materials at once.
+The floorspace (m2) is solved with the batched stock driven model for all (building type, region) series together,
+and multiplied with the material intensities (kg/m2) by age-cohort in one tensor contraction.
+The two steps can also be run separately (compute_floorspace_flows & compute_material_stocks), so that the stock model
+does not have to be solved again when only the material intensities change (e.g. cached as separate stages of the model).
+Only numpy arrays are used here, the conversion to pandas is done by the calling script at the output stage.
+The stock & outflow by cohort (CohortDetail) are kept in typed buffers (cohort_buffer): float64 or float32 (half the memory, the rounding error
+is reported with the results), in memory or as memory-mapped files in a scratch folder (so large runs can keep them without holding them in memory).
+
+Array layout:
+    Stock[b,r,t]             floorspace stock by building type b, region r & year t
+    lt                       lifetime distribution: dictionary with 'Type' and the parameters of that type by building type & region [b,r]
+    Intensity[b,r,c,k]       material intensity by building type, region, age-cohort c & material k (the cohorts are the same years as t)
+    Correction[b,r,t]        factor of the negative inflow correction by year, see compute_stock_driven_model_batch (ReturnCorrection)
+    InitialStock[b,r,c]      optional, the stock by age-cohort at the end of year SwitchTime-2, to start the stock model from (instead of the first year),
+                             the flows by year then start at that year (the inflow keeps all age-cohorts: the historic inflows follow from the initial stock)
+    MaxAge                   optional, banded tables: the lifetime distributions are cut off at this age, so the stock model & the rebuild of the stock
+                             by cohort only hold the age-cohorts of the last MaxAge years (see compute_max_age_batch for the age from a survival tolerance)
+
+dependencies:
+    numpy >= 1.9
+    dynamic_stock_model (ODYM, with the batched stock driven model)
+    instrumentation (each call is recorded when a RunMonitor is active)
+"""
+
+import os
+import tempfile
+import weakref
+import numpy as np
+from instrumentation import monitored
+from dynamic_stock_model import compute_stock_driven_model_batch, compute_stock_driven_cohorts_batch, compute_cohorts_from_band
+
+
+precisions = {'float64': np.float64, 'float32': np.float32}
+
+
+def cohort_buffer(Shape, Precision = 'float64', ScratchDir = None, Name = 'cohorts'):
+    """
+    Zero-filled buffer of Shape for cohort tables, with the dtype Precision ('float64' or 'float32'): in memory, or with a ScratchDir
+    a memory-mapped .npy file in it (Name_<random>.npy, so several buffers & runs can use the same folder). The file is removed when
+    its map is closed, i.e. when the buffer and all views of it are freed, else at the exit of the run (on Windows a file that is
+    still mapped at the exit can not be removed, it is left in the folder).
+    """
+    if Precision not in precisions:
+        raise ValueError('unknown precision: ' + str(Precision))
+    if ScratchDir is None:
+        return np.zeros(Shape, dtype=precisions[Precision])
+    os.makedirs(ScratchDir, exist_ok=True)
+    Handle, FileName = tempfile.mkstemp(prefix=Name + '_', suffix='.npy', dir=ScratchDir)
+    os.close(Handle)
+    Buffer = np.lib.format.open_memmap(FileName, mode='w+', dtype=precisions[Precision], shape=tuple(Shape))
+    weakref.finalize(Buffer._mmap, remove_file, FileName) # called after the map is closed (or at the exit)
+    return Buffer
+
+
+def remove_file(FileName):
+    """ Removes FileName if it can (it may be gone already, or still open elsewhere on Windows). """
+    try:
+        os.remove(FileName)
+    except OSError:
+        pass
+
+
+def series_lifetime(lt, Nb, Nr):
+    """ Lifetime parameters by building type & region [b,r] (or scalars) as parameters by series [n], n = b * Nr + r. """
+    lt_n = {'Type': lt['Type']}
+    for ThisKey in lt.keys():
+        if ThisKey != 'Type':
+            lt_n[ThisKey] = np.broadcast_to(np.asarray(lt[ThisKey], dtype=float), (Nb, Nr)).reshape(Nb * Nr)
+    return lt_n
+
+
+@monitored
+def compute_material_flows(t, Stock, lt, Intensity, NegativeInflowCorrect = True, NonNegativeOutflow = True, CohortDetail = False, Kernel = 'auto'):
+    """
+    Floorspace & material stock, inflow and outflow for all building types and regions.
+
+    Returns a dictionary with:
+      'm2_i'[b,r,t], 'm2_o'[b,r,t]      floorspace inflow & outflow
+      'kg_s'[b,r,t,k], 'kg_i'[b,r,t,k], 'kg_o'[b,r,t,k]     material stock, inflow & outflow
+      'm2_s_c'[b,r,t,c], 'm2_o_c'[b,r,t,c]    only if CohortDetail is True: floorspace stock & outflow by age-cohort
+
+    Without CohortDetail, the stock & outflow by cohort are contracted with the intensities year by year within the stock model (low memory),
+    with CohortDetail the full cohort tables are kept and contracted afterwards in one pass.
+    Kernel is that of compute_stock_driven_model_batch (the compiled recursion if numba is installed, see dsm_kernel), without CohortDetail.
+    """
+    Stock     = np.asarray(Stock, dtype=float)
+    Intensity = np.asarray(Intensity, dtype=float)
+    Nb, Nr, Nt = Stock.shape
+    Nk = Intensity.shape[3]
+
+    # all (building type, region) combinations are independent series of the batched stock model
+    s_n  = Stock.reshape(Nb * Nr, Nt)
+    lt_n = series_lifetime(lt, Nb, Nr)
+    Intensity_n = Intensity.reshape(Nb * Nr, Nt, Nk)
+
+    Result = {}
+    if CohortDetail is True:
+        s_c, o_c, i = compute_stock_driven_model_batch(t, s_n, lt_n, NegativeInflowCorrect = NegativeInflowCorrect, NonNegativeOutflow = NonNegativeOutflow)
+        kg_s = np.matmul(s_c, Intensity_n) # sum over the age-cohorts: [n,t,c] x [n,c,k] -> [n,t,k]
+        kg_o = np.matmul(o_c, Intensity_n)
+        m2_o = o_c.sum(axis=2)
+        Result['m2_s_c'] = s_c.reshape(Nb, Nr, Nt, Nt)
+        Result['m2_o_c'] = o_c.reshape(Nb, Nr, Nt, Nt)
+    else:
+        # first column of the intensity is 1, to obtain the floorspace outflow from the same contraction
+        Intensity_m2 = np.concatenate((np.ones((Nb * Nr, Nt, 1)), Intensity_n), axis=2)
+        s_k, o_k, i = compute_stock_driven_model_batch(t, s_n, lt_n, NegativeInflowCorrect = NegativeInflowCorrect, NonNegativeOutflow = NonNegativeOutflow, Intensity = Intensity_m2,
+                                                       Kernel = Kernel)
+        kg_s = s_k[:,:,1:]
+        kg_o = o_k[:,:,1:]
+        m2_o = o_k[:,:,0]
+
+    Result['m2_i'] = i.reshape(Nb, Nr, Nt)
+    Result['m2_o'] = m2_o.reshape(Nb, Nr, Nt)
+    Result['kg_s'] = kg_s.reshape(Nb, Nr, Nt, Nk)
+    Result['kg_i'] = Result['m2_i'][:,:,:,np.newaxis] * Intensity  # the inflow in year t is age-cohort t
+    Result['kg_o'] = kg_o.reshape(Nb, Nr, Nt, Nk)
+    return Result
+
+
+@monitored
+def compute_floorspace_flows(t, Stock, lt, NegativeInflowCorrect = True, NonNegativeOutflow = True, InitialStock = None, SwitchTime = None, Checkpoints = None,
+                             MaxAge = None, Kernel = 'auto'):
+    """
+    Floorspace inflow & outflow for all building types and regions, the first step of compute_material_flows.
+    With InitialStock[b,r,c] (the stock by age-cohort at the end of year SwitchTime-2), the stock model starts from the initial stock.
+    With Checkpoints (a pipeline.CheckpointStore), the stock model resumes from the latest checkpoint that was kept for the same stock up to its year
+    (& the same lifetimes & settings), and keeps the states of the checkpoint years it computes.
+    Kernel is that of compute_stock_driven_model_batch: 'auto' (the compiled recursion if numba is installed, see dsm_kernel), 'numpy' or 'jit'.
+
+    Returns a dictionary with:
+      'm2_i'[b,r,t], 'm2_o'[b,r,t]      floorspace inflow & outflow (with an initial stock, the outflow of the years from SwitchTime-2 only)
+      'correction'[b,r,t]                the negative inflow correction by year, needed to rebuild the stock by age-cohort
+    """
+    Stock = np.asarray(Stock, dtype=float)
+    Nb, Nr, Nt = Stock.shape
+    if InitialStock is not None:
+        InitialStock = np.asarray(InitialStock, dtype=float).reshape(Nb * Nr, -1)
+    lt_n = series_lifetime(lt, Nb, Nr)
+    Resume, CheckpointYears = None, ()
+    if Checkpoints is not None and Checkpoints.Enabled is True:
+        Context = {'NegativeInflowCorrect': NegativeInflowCorrect, 'NonNegativeOutflow': NonNegativeOutflow, 'InitialStock': InitialStock, 'SwitchTime': SwitchTime,
+                   'MaxAge': MaxAge}
+        Context.update({'lt_' + ThisKey: Value for ThisKey, Value in lt_n.items()})
+        Resume, CheckpointYears = Checkpoints.latest(Stock.reshape(Nb * Nr, Nt), Context), Checkpoints.Years
+    # the outflow by cohort is summed within the stock model (an intensity of 1), so the cohort tables are not kept
+    Results = compute_stock_driven_model_batch(t, Stock.reshape(Nb * Nr, Nt), lt_n, NegativeInflowCorrect = NegativeInflowCorrect,
+                                               NonNegativeOutflow = NonNegativeOutflow, Intensity = np.ones((Nb * Nr, Nt, 1)), ReturnCorrection = True,
+                                               InitialStock = InitialStock, SwitchTime = SwitchTime, Resume = Resume, CheckpointYears = CheckpointYears, MaxAge = MaxAge,
+                                               Kernel = Kernel)
+    s_k, o_k, i, Correction = Results[0:4]
+    if len(CheckpointYears) > 0:
+        Checkpoints.save(Results[4], Stock.reshape(Nb * Nr, Nt), Context)
+    return {'m2_i': i.reshape(Nb, Nr, Nt), 'm2_o': o_k[:,:,0].reshape(Nb, Nr, -1), 'correction': Correction.reshape(Nb, Nr, Nt)}
+
+
+@monitored
+def compute_material_stocks(t, Inflow, Correction, lt, Intensity, NonNegativeOutflow = True, CohortDetail = False, Chunk = 26, FirstYear = 0, MaxAge = None,
+                            Precision = 'float64', ScratchDir = None):
+    """
+    Material stock, inflow and outflow for all building types and regions, from the results of compute_floorspace_flows (the second step).
+    The stock & outflow by age-cohort are rebuilt from the inflow & the correction factors, for Chunk series at a time (to limit the memory use),
+    and contracted with the intensities. With FirstYear > 0 (e.g. the year of the initial stock), only the years from FirstYear are computed,
+    the year axis of the results then starts at FirstYear. With MaxAge (the same as in compute_floorspace_flows), the stock by cohort is rebuilt
+    by age within the band, and contracted age by age (the full cohort tables are only built with CohortDetail).
+    With CohortDetail, the cohort tables are stored with the given Precision, in memory or memory-mapped in ScratchDir (see cohort_buffer);
+    the material results are always contracted in float64.
+
+    Returns a dictionary with:
+      'kg_s'[b,r,t,k], 'kg_i'[b,r,t,k], 'kg_o'[b,r,t,k]     material stock, inflow & outflow
+      'm2_s_c'[b,r,t,c], 'm2_o_c'[b,r,t,c]    only if CohortDetail is True: floorspace stock & outflow by age-cohort
+      'm2_c_error'                       only if CohortDetail is True: the rounding error of the stored cohort tables (0 with float64), as
+                                         'cohort': the largest error of a value & 'stock': of the stock summed over the age-cohorts (in Precision),
+                                         both relative to the largest value
+    """
+    Inflow    = np.asarray(Inflow, dtype=float)
+    Intensity = np.asarray(Intensity, dtype=float)
+    Nb, Nr, Nt = Inflow.shape
+    Nk = Intensity.shape[3]
+
+    i_n          = Inflow.reshape(Nb * Nr, Nt)
+    Correction_n = np.asarray(Correction, dtype=float).reshape(Nb * Nr, Nt)
+    lt_n         = series_lifetime(lt, Nb, Nr)
+    Intensity_n  = Intensity.reshape(Nb * Nr, Nt, Nk)
+
+    Ny = Nt - FirstYear # No of years of the results
+    kg_s = np.zeros((Nb * Nr, Ny, Nk))
+    kg_o = np.zeros((Nb * Nr, Ny, Nk))
+    if CohortDetail is True:
+        s_c = cohort_buffer((Nb * Nr, Ny, Nt), Precision, ScratchDir, 'm2_s_c')
+        o_c = cohort_buffer((Nb * Nr, Ny, Nt), Precision, ScratchDir, 'm2_o_c')
+        Error = {'cohort': 0.0, 'stock': 0.0, 'scale': 0.0, 'stock_scale': 0.0}
+    for Start in range(0, Nb * Nr, Chunk):
+        Series = slice(Start, min(Start + Chunk, Nb * Nr))
+        lt_chunk = {ThisKey: (lt_n[ThisKey] if ThisKey == 'Type' else lt_n[ThisKey][Series]) for ThisKey in lt_n.keys()}
+        if MaxAge is not None and CohortDetail is not True:
+            # banded: the stock & outflow by age are contracted with the intensity of their age-cohort within the rebuild
+            kg_s[Series], kg_o[Series] = compute_stock_driven_cohorts_batch(t, i_n[Series], lt_chunk, Correction = Correction_n[Series], NonNegativeOutflow = NonNegativeOutflow,
+                                                                            Intensity = Intensity_n[Series], FirstYear = FirstYear, MaxAge = MaxAge)
+        else:
+            s_c_chunk, o_c_chunk = compute_stock_driven_cohorts_batch(t, i_n[Series], lt_chunk, Correction = Correction_n[Series], NonNegativeOutflow = NonNegativeOutflow,
+                                                                      FirstYear = FirstYear, MaxAge = MaxAge)
+            if MaxAge is not None: # by age-cohort instead of by age
+                s_c_chunk, o_c_chunk = compute_cohorts_from_band(s_c_chunk, FirstYear), compute_cohorts_from_band(o_c_chunk, FirstYear)
+            kg_s[Series] = np.matmul(s_c_chunk, Intensity_n[Series]) # sum over the age-cohorts: [n,t,c] x [n,c,k] -> [n,t,k]
+            kg_o[Series] = np.matmul(o_c_chunk, Intensity_n[Series])
+            if CohortDetail is True:
+                s_c[Series] = s_c_chunk
+                o_c[Series] = o_c_chunk
+                # rounding error of the stored tables, against the float64 tables of the chunk
+                Error['cohort'] = max(Error['cohort'], float(np.max(np.abs(s_c[Series] - s_c_chunk))), float(np.max(np.abs(o_c[Series] - o_c_chunk))))
+                Error['scale']  = max(Error['scale'], float(np.max(np.abs(s_c_chunk))), float(np.max(np.abs(o_c_chunk))))
+                Error['stock']  = max(Error['stock'], float(np.max(np.abs(s_c[Series].sum(axis=2) - s_c_chunk.sum(axis=2)))))
+                Error['stock_scale'] = max(Error['stock_scale'], float(np.max(np.abs(s_c_chunk.sum(axis=2)))))
+
+    Result = {}
+    if CohortDetail is True:
+        Result['m2_s_c'] = s_c.reshape(Nb, Nr, Ny, Nt)
+        Result['m2_o_c'] = o_c.reshape(Nb, Nr, Ny, Nt)
+        Result['m2_c_error'] = {'cohort': Error['cohort'] / Error['scale'] if Error['scale'] > 0 else 0.0,
+                                'stock':  Error['stock'] / Error['stock_scale'] if Error['stock_scale'] > 0 else 0.0}
+    Result['kg_s'] = kg_s.reshape(Nb, Nr, Ny, Nk)
+    Result['kg_i'] = Inflow[:,:,FirstYear:,np.newaxis] * Intensity[:,:,FirstYear:,:]  # the inflow in year t is age-cohort t
+    Result['kg_o'] = kg_o.reshape(Nb, Nr, Ny, Nk)
+    return Result
+
+
+# The end.
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Material intensity for BUMA
+
+Dense material intensity tables (kg/m2) by year, region, building type & material.
+The intensities in the database are given for a few years only. They are interpolated linearly to every year of the model period,
+values before the first year in the database are kept at the first value and values after the last year at the last value.
+The interpolation is done for all regions, building types & materials in one go, and the result is cached on disk,
+so that reruns with the same database files skip the interpolation.
+
+Array layout:
+    residential[y,r,b,k]     year y, region r, residential building type b (1-4) & material k
+    commercial[y,b,k]        year y, commercial building type b (Offices, Retail+, Hotels+, Govt+) & material k,
+                             the same for all regions, use commercial_by_region for a (read-only) view with a region axis
+
+dependencies:
+    numpy >= 1.9
+    pandas
+"""
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+def interpolate_years(Years, DataYears, Values):
+    """
+    Linear interpolation of Values[d,...] (given for the years DataYears[d]) to all Years[y], along the first axis.
+    Same as a pandas reindex + interpolate: data after the last model year is not used,
+    and values before the first or after the last data year are kept constant.
+    """
+    Years     = np.asarray(Years)
+    DataYears = np.asarray(DataYears)
+    Values    = np.asarray(Values, dtype=float)
+    Keep      = DataYears <= Years[-1]
+    # the first model year is set to the value of the first data year
+    xp = np.concatenate(([Years[0]], DataYears[Keep][DataYears[Keep] > Years[0]]))
+    fp = np.concatenate((Values[[0]], Values[Keep][DataYears[Keep] > Years[0]]), axis=0)
+    if len(xp) == 1:
+        return np.repeat(fp, len(Years), axis=0)
+    j = np.clip(np.searchsorted(xp, Years, side='right') - 1, 0, len(xp) - 2) # the data interval of each year
+    Shape = (-1,) + (1,) * (Values.ndim - 1)
+    # slope form, as in numpy.interp
+    Slope = (fp[j + 1] - fp[j]) / (xp[j + 1] - xp[j]).reshape(Shape)
+    Interpolated = Slope * (Years - xp[j]).reshape(Shape) + fp[j]
+    # after the last data year: keep the last value
+    return np.where((Years >= xp[-1]).reshape(Shape), fp[-1], Interpolated)
+
+
+def residential_intensity(building_materials, Years, Materials):
+    """
+    Residential material intensity [y,r,b,k] from the database table (index: year, region, building type; columns: materials).
+    Materials that are not in the table (e.g. Cement) are zero.
+    """
+    Table     = building_materials.sort_index()
+    DataYears = Table.index.get_level_values(0).unique()
+    Regions   = Table.index.get_level_values(1).unique()
+    Types     = Table.index.get_level_values(2).unique()
+    Columns   = {column.lower(): column for column in Table.columns}
+    Values = np.zeros((len(DataYears), len(Regions), len(Types), len(Materials)))
+    for k, Material in enumerate(Materials):
+        if Material.lower() in Columns:
+            Values[:,:,:,k] = Table[Columns[Material.lower()]].to_numpy(dtype=float).reshape(len(DataYears), len(Regions), len(Types))
+    return interpolate_years(Years, DataYears, Values)
+
+
+def commercial_intensity(materials_commercial, Years, Materials):
+    """
+    Commercial material intensity [y,b,k] from the database table (index: year, material; columns: commercial building types).
+    Materials that are not in the table are zero.
+    """
+    DataYears = materials_commercial.index.get_level_values(0).unique().sort_values()
+    Names     = {name.lower(): name for name in materials_commercial.index.get_level_values(1).unique()}
+    Values = np.zeros((len(DataYears), len(materials_commercial.columns), len(Materials)))
+    for k, Material in enumerate(Materials):
+        if Material.lower() in Names:
+            Values[:,:,k] = materials_commercial.xs(Names[Material.lower()], level=1).loc[DataYears].to_numpy(dtype=float)
+    return interpolate_years(Years, DataYears, Values)
+
+
+def commercial_by_region(commercial, Nr):
+    """ Commercial material intensity [y,r,b,k] for Nr regions, as a read-only broadcast view (no copies by region). """
+    return np.broadcast_to(commercial[:,np.newaxis,:,:], (commercial.shape[0], Nr) + commercial.shape[1:])
+
+
+def load_intensity(file_residential, file_commercial, file_addition, Years, Materials, CacheDir = 'cache', Reader = pd.read_csv):
+    """
+    Residential [y,r,b,k] and commercial [y,b,k] material intensity for the database files, interpolated to Years.
+    The result is stored in CacheDir, keyed by the content (hash) of both files, the file_addition variant, the years, the materials
+    & the source of this module (the interpolation).
+    Set CacheDir = None to always interpolate.
+    Reader reads the csv-files (with the arguments of pandas.read_csv), e.g. InputStore.read_csv.
+    """
+    Years = np.asarray(Years)
+    Hash  = hashlib.sha256()
+    for FileName in (file_residential, file_commercial):
+        with open(FileName, 'rb') as File:
+            Hash.update(File.read())
+    with open(os.path.abspath(__file__), 'rb') as File:
+        Hash.update(File.read())
+    Hash.update(repr((file_addition, int(Years[0]), int(Years[-1]), len(Years), list(Materials))).encode())
+    CacheFile = None if CacheDir is None else os.path.join(CacheDir, 'intensity' + file_addition + '_' + Hash.hexdigest()[0:16] + '.npz')
+
+    if CacheFile is not None and os.path.isfile(CacheFile):
+        with np.load(CacheFile) as Cached:
+            return Cached['residential'], Cached['commercial']
+
+    residential = residential_intensity(Reader(file_residential, index_col = [0,1,2]), Years, Materials)
+    commercial  = commercial_intensity(Reader(file_commercial, index_col = [0,1]), Years, Materials)
+
+    if CacheFile is not None:
+        os.makedirs(CacheDir, exist_ok=True)
+        TempFile = CacheFile + '.' + str(os.getpid()) + '.tmp.npz' # by process, so parallel workers never write to the same file
+        np.savez(TempFile, residential=residential, commercial=commercial)
+        os.replace(TempFile, CacheFile) # no partially written cache files, e.g. with several runs at once
+    return residential, commercial
+
+
+# The end.
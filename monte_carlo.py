@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo uncertainty analysis for BUMA
+
+Instead of the corner cases of the sensitivity flags (low/high/mean/median intensity files, Weibull vs Normal lifetimes),
+the uncertain inputs are sampled for each draw:
+    - the parameters of the commercial demand curves (Gompertz a, b & c of the total & the 4 commercial types, or the ExpDec curve),
+      a lognormal factor (mean 1) by curve & parameter, with a relative standard deviation of gompertz_sd
+    - the lifetime parameters of lifetimes.csv (shape & scale, or mean & stdev for the Normal distribution) & the commercial lifetime,
+      a lognormal factor (mean 1) by building type, region & parameter, with a relative standard deviation of lifetime_sd
+    - the material intensities, a factor on the (dynamic) regular intensities by region, residential building type & material,
+      from a triangular distribution between the low & high values (files_DB/Building_materials_low.csv & _high.csv),
+      relative to the regular values (Building_materials.csv); for commercial buildings by type & material (materials_commercial*.csv).
+      Materials without low & high values (e.g. brick) are not varied.
+The other inputs are taken from the regular model run (the residential floorspace & the population, from the stage cache).
+
+The draws are run in batches, each batch is one vectorized run of the stock & material model for all draws, building types & regions
+(in a pool of processes). The material stock, inflow & outflow (summed over the building types) of each draw are added to a
+streaming quantile estimator (quantile_sketch.StreamingQuantiles) as soon as the batch is done, so the memory use does not grow with the number of draws.
+
+Random numbers: each batch gets its own, independent stream (numpy SeedSequence.spawn of the seed), and the batches are aggregated in order,
+so the results only depend on the seed, the number of draws & the batch size, not on the number of workers.
+
+Array layout:
+    result[d,f,r,k,y]        draw d, flow f (stock, inflow, outflow), region r, material k & year y (from first_year)
+
+Usage (from the model folder):
+    python monte_carlo.py [--draws 1000] [--seed 0] [--workers N] [--batch 2]
+
+dependencies:
+    numpy >= 1.17 (numpy.random.Generator)
+    pandas
+"""
+
+import os
+import sys
+import time
+import argparse
+import collections
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+import building_materials
+import demand_curves
+from historic_tail import build_tail, trend_factor
+from material_engine import compute_material_flows
+from quantile_sketch import StreamingQuantiles
+from scenario_sweep import share, attach
+
+# Uncertainty settings
+gompertz_sd = 0.05      # relative standard deviation of the demand curve parameters (no standard errors are available for the fitted curves)
+lifetime_sd = 0.10      # relative standard deviation of the lifetime parameters
+intensity_range = 1     # 1 = sample the material intensities between the low & high values, 0 = regular intensities only
+quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+curve_names = ['All', 'Office', 'Retail+', 'Hotels+', 'Govt+']     # columns of Gompertz_parameters.csv
+file_intensity_regular    = 'files_DB/Building_materials.csv'
+file_intensity_low        = 'files_DB/Building_materials_low.csv'
+file_intensity_high       = 'files_DB/Building_materials_high.csv'
+file_commercial_regular   = 'files_DB/materials_commercial.csv'
+file_commercial_low       = 'files_DB/materials_commercial_low.csv'
+file_commercial_high      = 'files_DB/materials_commercial_high.csv'
+
+
+#%% Regular model & input ranges
+
+def intensity_ranges(regions):
+    """
+    Lowest & highest intensity relative to the regular intensity, by building (in the order of building_materials.building_names), region (labels regions) & material [b,r,k].
+    Returns 1 where no range is given (or the regular value is 0).
+    """
+    Nb, Nr, Nk = len(building_materials.building_names), len(regions), len(building_materials.material_names)
+    low, high = np.ones((Nb, Nr, Nk)), np.ones((Nb, Nr, Nk))
+
+    def ratio(regular, other):
+        return np.divide(other, regular, out=np.ones(np.shape(regular)), where=regular != 0)
+
+    res = [pd.read_csv(file, index_col = [0,1]).sort_index() for file in (file_intensity_regular, file_intensity_low, file_intensity_high)]
+    com = [pd.read_csv(file, index_col = [0]) for file in (file_commercial_regular, file_commercial_low, file_commercial_high)]
+    for k, material in enumerate(building_materials.material_names):
+        columns = {column.lower(): column for column in res[0].columns}
+        rows    = {row.lower(): row for row in com[0].index}
+        for b, building in enumerate(building_materials.building_names):
+            area, label, lifetime_type, intensity_type = building_materials.buildings[building]
+            if area != 'commercial' and material in columns:
+                values = [np.array(table[columns[material]].xs(intensity_type, level=1).loc[regions], dtype=float) for table in res]
+            elif area == 'commercial' and material in rows:
+                values = [np.full(Nr, float(table.loc[rows[material], intensity_type])) for table in com]
+            else:
+                continue
+            # the low & high files do not always bracket the regular values, so the range is taken around all three
+            low[b,:,k]  = ratio(values[0], np.minimum.reduce(values))
+            high[b,:,k] = ratio(values[0], np.maximum.reduce(values))
+    return low, high
+
+
+def base_model(end_year = building_materials.end_year, flag_alpha = building_materials.flag_alpha, flag_ExpDec = building_materials.flag_ExpDec,
+               flag_Normal = building_materials.flag_Normal, cache_dir = building_materials.cache_dir):
+    """ The inputs of the Monte Carlo analysis from the regular model run (regular intensities, flag_Mean = 0), as a dictionary of arrays. """
+    stages = building_materials.run_model(end_year = end_year, flag_alpha = flag_alpha, flag_ExpDec = flag_ExpDec, flag_Normal = flag_Normal, flag_Mean = 0, cache_dir = cache_dir)
+    inputs, tail, dsm = stages.result('inputs'), stages.result('tail'), stages.result('dsm')
+    T, regions = len(tail['years_model']), inputs['regions']
+    gompertz = inputs['gompertz']
+    curves = np.array([[gompertz[name][parameter] for name in curve_names] for parameter in ['a', 'b', 'c']], dtype=float)   # parameter x curve
+    if flag_ExpDec == 1:
+        curves[:,0] = [building_materials.expdec_parameters[parameter] for parameter in ['a', 'b', 'c']]
+    parameters = [name for name in dsm['lifetime'].keys() if name != 'Type']
+    low, high = intensity_ranges(regions)
+    return {'end_year': end_year, 'flag_ExpDec': flag_ExpDec, 'regions': np.array(regions),
+            'sva_pc_array': np.array(inputs['sva_pc'].loc[list(range(1971,end_year + 1)), [str(region) for region in regions]], dtype=float),     # year x region
+            'curves': curves,
+            'pop': tail['tail_array'][building_materials.tail_names.index('pop')],                                                                # year x region
+            'm2_res': stages.result('floorspace')['m2_res'].reshape(-1, len(regions), T),                                                          # building x region x year
+            'lifetime_type': dsm['lifetime']['Type'], 'lifetime_names': parameters,
+            'lifetime': np.stack([dsm['lifetime'][name] for name in parameters]),                                                                  # parameter x building x region
+            'intensity': building_materials.intensity_by_building(end_year, '', regions, cache_dir),                                                         # building x region x cohort x material
+            'intensity_low': low, 'intensity_high': high}
+
+
+#%% Sampling & the vectorized model
+
+def lognormal_factor(rng, sd, shape):
+    """ Lognormal factors with a mean of 1 & a relative standard deviation of (about) sd. """
+    sigma = np.sqrt(np.log(1 + sd**2))
+    return np.exp(sigma * rng.standard_normal(shape) - sigma**2 / 2)
+
+
+def triangular_factor(u, low, high):
+    """ Inverse of the triangular distribution between low & high with mode 1, for uniform u (no spread where low == high). """
+    width = high - low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        split = np.where(width > 0, (1 - low) / width, 0)
+        value = np.where(u < split, low + np.sqrt(u * width * (1 - low)), high - np.sqrt((1 - u) * width * (high - 1)))
+    return np.where(width > 0, value, 1.0)
+
+
+def simulate_batch(base, seed, draws, first_year = 1971, tail_start = building_materials.tail_start, ramp_length = building_materials.ramp_length,
+                   gompertz_sd = gompertz_sd, lifetime_sd = lifetime_sd, intensity_range = intensity_range):
+    """ Material stock, inflow & outflow [d,f,r,k,y] of a batch of draws, with the random stream of seed (a SeedSequence or integer). """
+    rng = np.random.default_rng(seed)
+    end_year = base['end_year']
+    years_model = np.arange(1721, end_year + 1)
+    years_hist  = np.arange(1721, 1971)
+    T, S, Nr = len(years_model), draws, len(base['regions'])
+
+    # 1) commercial floorspace demand (m2/cap) with sampled curve parameters: draw x category x year x region
+    curves = base['curves'][np.newaxis] * lognormal_factor(rng, gompertz_sd, (S,) + base['curves'].shape)
+    parameters = {name: {parameter: curves[:,p,c,np.newaxis,np.newaxis] for p, parameter in enumerate(['a', 'b', 'c'])} for c, name in enumerate(curve_names)}
+    sva = base['sva_pc_array']
+    if base['flag_ExpDec'] == 0:
+        total = demand_curves.gompertz(sva, parameters['All']['a'], parameters['All']['b'], parameters['All']['c'])
+    else:
+        total = demand_curves.expdec(sva, parameters['All']['a'], parameters['All']['b'], parameters['All']['c'], Minimum = 0.542)
+    split, lowest = demand_curves.commercial_split(sva, parameters, ['Office', 'Retail+', 'Hotels+', 'Govt+'], total, Minimum = 25)
+
+    # 2) historic tail of the commercial floorspace/cap (as in building_materials.add_tail, for all draws at once) & the commercial m2
+    trend_global = (1 - ((split[:,:,0:10,:] / split[:,:,1:11,:]).sum(axis=2) / 10).sum(axis=2) / Nr) * 100      # draw x category, in % decrease per annum
+    tails = np.zeros((split.shape[1], T, S, Nr))
+    for g in range(0, split.shape[1]):
+        build_tail(years_model, split[:,g].transpose(1,0,2), split[:,g,0,:], trend_factor(years_hist, 1971, (100 - trend_global[:,g,np.newaxis]) / 100),
+                   tail_start, ramp_length, Lower = lowest[:,g,np.newaxis], out = tails[g])
+    m2_comm = (tails * base['pop'][np.newaxis,:,np.newaxis,:]).transpose(2,0,3,1)                                  # draw x category x region x year
+    stock = np.concatenate((np.broadcast_to(base['m2_res'], (S,) + base['m2_res'].shape), m2_comm), axis=1)     # draw x building x region x year
+    Nb = stock.shape[1]
+
+    # 3) lifetimes & material intensities
+    lifetime = base['lifetime'][np.newaxis] * lognormal_factor(rng, lifetime_sd, (S,) + base['lifetime'].shape)
+    lt = {'Type': base['lifetime_type']}
+    for p, name in enumerate(base['lifetime_names']):
+        lt[name] = lifetime[:,p].reshape(S * Nb, Nr)
+    intensity = base['intensity']
+    if intensity_range == 1:
+        # one draw by region, residential type & material (the same for rural & urban), or by commercial type & material (the same for all regions)
+        types = [building_materials.buildings[building][3] for building in building_materials.building_names]
+        u_res = rng.random((S, 4, Nr, intensity.shape[3]))
+        u_com = rng.random((S, len(building_materials.commercial_types), 1, intensity.shape[3]))
+        u = np.stack([np.broadcast_to(u_com[:,building_materials.commercial_types.index(kind)], u_res[:,0].shape) if isinstance(kind, str) else u_res[:,kind - 1] for kind in types], axis=1)
+        factor = triangular_factor(u, base['intensity_low'], base['intensity_high'])   # draw x building x region x material
+        intensity = intensity[np.newaxis] * factor[:,:,:,np.newaxis,:]
+    else:
+        intensity = np.broadcast_to(intensity, (S,) + intensity.shape)
+
+    # 4) stock model & material flows for all draws, buildings & regions at once, summed over the buildings
+    flows = compute_material_flows(np.arange(0,T,1), stock.reshape(S * Nb, Nr, T), lt, intensity.reshape((S * Nb,) + intensity.shape[2:]),
+                                   NegativeInflowCorrect = True, NonNegativeOutflow = True)
+    first = first_year - 1721
+    result = np.stack([flows[name].reshape((S, Nb) + flows[name].shape[1:]).sum(axis=1)[:,:,first:,:] for name in ['kg_s', 'kg_i', 'kg_o']], axis=1)  # draw x flow x region x year x material
+    return result.transpose(0,1,2,4,3)
+
+
+#%% Parallel runs & aggregation
+
+_base = {}
+
+def init_worker(description):
+    _base.update(attach(description))
+
+
+def run_batch(seed, draws, settings):
+    return simulate_batch(_base, seed, draws, **settings)
+
+
+def run_monte_carlo(draws = 1000, seed = 0, workers = None, batch = 2, first_year = 1971, quantiles = quantiles, base = None, **settings):
+    """
+    Run draws Monte Carlo draws (in batches of batch draws) & return the StreamingQuantiles of the results [f,r,k,y].
+    settings are passed to simulate_batch (e.g. gompertz_sd, lifetime_sd, intensity_range, tail_start).
+    Each batch holds the stock model arrays of all its series (the sf by age & the stock & outflow contracted with the intensities, no survival tables),
+    about 50 MB by draw at the peak.
+    """
+    base = base_model() if base is None else base
+    Nb = -(-draws // batch) # No of batches
+    seeds = np.random.SeedSequence(seed).spawn(Nb)
+    sizes = [min(batch, draws - b * batch) for b in range(0, Nb)]
+    settings = dict(settings, first_year = first_year)
+    sketch = StreamingQuantiles((3, len(base['regions']), len(building_materials.material_names), base['end_year'] - first_year + 1), quantiles)
+
+    workers = min(workers or os.cpu_count() or 1, Nb)
+    start = time.time()
+    if workers == 1:
+        for b in range(0, Nb):
+            for result in simulate_batch(base, seeds[b], sizes[b], **settings):
+                sketch.add(result)
+        return sketch
+
+    blocks, description = share(base)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(description,)) as pool:
+            # a limited number of batches is submitted ahead, & the results are added in the order of the batches (reproducible)
+            pending = collections.deque()
+            for b in range(0, Nb + 2 * workers):
+                if b < Nb:
+                    pending.append(pool.submit(run_batch, seeds[b], sizes[b], settings))
+                if len(pending) == 2 * workers or (b >= Nb and len(pending) > 0):
+                    for result in pending.popleft().result():
+                        sketch.add(result)
+                    print(str(sketch.Count) + ' of ' + str(draws) + ' draws, ' + str(round(time.time() - start)) + ' s')
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return sketch
+
+
+def sketch_table(sketch, first_year = 1971, regions = None):
+    """ The mean, standard deviation & quantiles of the results as one dataframe (statistic, flow, material, region x year), like the csv output.
+    regions are the labels of the regions (base_model()['regions']), 1 to the number of regions by default. """
+    statistics = np.concatenate((sketch.mean()[np.newaxis], sketch.std()[np.newaxis], sketch.quantiles()))
+    names = ['mean', 'std'] + ['p' + str(round(q * 100, 1)).replace('.0', '') for q in sketch.Quantiles]
+    Ns, Nf, Nr, Nk, Ny = statistics.shape
+    regions = list(range(1, Nr + 1)) if regions is None else regions
+    table = pd.DataFrame(statistics.transpose(0,1,3,2,4).reshape(-1, Ny), index=np.tile(regions, Ns * Nf * Nk), columns=list(range(first_year, first_year + Ny)))
+    table.insert(0,'material',  np.tile(np.repeat(building_materials.material_names, Nr), Ns * Nf))
+    table.insert(0,'flow',      np.tile(np.repeat(building_materials.tag, Nk * Nr), Ns))
+    table.insert(0,'statistic', np.repeat(names, Nf * Nk * Nr))
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo uncertainty analysis of the BUMA material stock & flows.')
+    parser.add_argument('--draws',   type=int, default=1000)
+    parser.add_argument('--seed',    type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='size of the process pool (default: number of cpus)')
+    parser.add_argument('--batch',   type=int, default=2, help='draws by batch (vectorized run of the model)')
+    parser.add_argument('--output',  default=os.path.join('output', 'monte_carlo_material.csv'))
+    arguments = parser.parse_args()
+
+    base = base_model()
+    sketch = run_monte_carlo(arguments.draws, arguments.seed, arguments.workers, arguments.batch, base = base)
+    os.makedirs(os.path.dirname(arguments.output) or '.', exist_ok=True)
+    sketch_table(sketch, regions = base['regions']).to_csv(arguments.output) # in kt
+    sys.exit(0)
+
+
+# The end.
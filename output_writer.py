@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar output for BUMA
+
+The results of the model as tidy tables (one row by building type, region & year) in a columnar format (Parquet or Feather),
+partitioned by flow (stock, inflow, outflow) & material in hive-style folders, e.g. output/material_output/flow=inflow/material=steel/part-0.parquet
+    - the building type & area are categorical columns (the same categories in all partitions), the region & year are small integers
+    - each block (flow & material) is written as soon as it is taken from the arrays, so the full table is never built in memory
+    - the rows of each block are sorted by year and written in row groups of a few years (Parquet), so that readers skip the other years
+A part of the results is read with read_output, e.g. read_output('output/material_output', flow='inflow', material='steel', years=(2020, 2050)),
+or with any reader of partitioned Parquet datasets (e.g. pandas.read_parquet with filters).
+The folder holds a _dataset.json with the layout & the unit of the values (ignored by dataset readers, as its name starts with _).
+
+Array layout:
+    Values[b,r,t,k]          flow by building type b, region r, year t & material k (or Values[b,r,t] without materials)
+
+dependencies:
+    numpy >= 1.9
+    pandas
+    pyarrow (optional, only needed for this output)
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+formats = {'parquet': '.parquet', 'feather': '.feather'}
+
+
+def tidy_block(Values, Types, Areas, Years, Regions = None):
+    """ Dataframe of Values[b,r,t] with the columns type, area, region, year & value, sorted by year (then building type & region).
+    Regions are the (integer) labels of the regions, 1 to Nr by default. """
+    Nb, Nr, Nt = Values.shape
+    Regions = np.arange(1, Nr + 1) if Regions is None else Regions
+    TypeCodes = np.tile(np.repeat(np.arange(0,Nb), Nr), Nt)
+    Categories = {'type': list(dict.fromkeys(Types)), 'area': list(dict.fromkeys(Areas))}
+    return pd.DataFrame({'type':   pd.Categorical.from_codes(np.array([Categories['type'].index(Label) for Label in Types])[TypeCodes], Categories['type']),
+                         'area':   pd.Categorical.from_codes(np.array([Categories['area'].index(Label) for Label in Areas])[TypeCodes], Categories['area']),
+                         'region': np.tile(np.asarray(Regions, dtype=np.int16 if np.max(Regions) < 2**15 else np.int32), Nb * Nt),
+                         'year':   np.repeat(np.asarray(Years, dtype=np.int16), Nb * Nr),
+                         'value':  np.ascontiguousarray(Values.transpose(2,0,1)).reshape(-1)})
+
+
+def write_block(FileName, Frame, Format = 'parquet', RowGroupSize = None):
+    """ Write one block (partition) as a Parquet or Feather file, via a temporary file. """
+    import pyarrow
+    Table = pyarrow.Table.from_pandas(Frame, preserve_index=False)
+    os.makedirs(os.path.dirname(FileName), exist_ok=True)
+    TempFile = os.path.join(os.path.dirname(FileName), '.' + os.path.basename(FileName) + '.' + str(os.getpid()) + '.tmp')   # hidden from dataset readers
+    if Format == 'parquet':
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(Table, TempFile, row_group_size=RowGroupSize)
+    else:
+        import pyarrow.feather
+        pyarrow.feather.write_feather(Table, TempFile)
+    os.replace(TempFile, FileName)
+
+
+def write_output(Folder, Flows, Types, Areas, Years, Materials = None, Format = 'parquet', Unit = None, RowGroupYears = 10, Regions = None):
+    """
+    Write the Flows (dictionary of flow name: Values[b,r,t,k], or Values[b,r,t] if Materials is None) to Folder,
+    partitioned by flow (& material). Types & Areas are the labels of the building types, Years those of the time axis,
+    Regions those of the regions (1 to Nr by default).
+    The folder is replaced if it holds an earlier output (a _dataset.json), other folders are not touched.
+    Returns the names of the files written.
+    """
+    if Format not in formats:
+        raise ValueError('unknown output format: ' + str(Format))
+    if os.path.isfile(os.path.join(Folder, '_dataset.json')):
+        shutil.rmtree(Folder)
+    Files = []
+    for Flow, Values in Flows.items():
+        Values = np.asarray(Values)
+        for k in range(0, 1 if Materials is None else len(Materials)):
+            Partition = 'flow=' + Flow if Materials is None else os.path.join('flow=' + Flow, 'material=' + Materials[k])
+            Frame = tidy_block(Values if Materials is None else Values[:,:,:,k], Types, Areas, Years, Regions)
+            FileName = os.path.join(Folder, Partition, 'part-0' + formats[Format])
+            write_block(FileName, Frame, Format, RowGroupSize = RowGroupYears * Values.shape[0] * Values.shape[1])
+            Files.append(FileName)
+    with open(os.path.join(Folder, '_dataset.json'), 'w') as File:
+        json.dump({'format': Format, 'partitioning': ['flow'] + ([] if Materials is None else ['material']),
+                   'columns': ['type', 'area', 'region', 'year', 'value'], 'unit': Unit,
+                   'flows': list(Flows.keys()), 'materials': Materials, 'years': [int(Years[0]), int(Years[-1])]}, File, indent=1)
+    return Files
+
+
+def read_output(Folder, flow = None, material = None, years = None, Format = None):
+    """
+    Read (a part of) the output in Folder as a dataframe: only the partitions of the given flow(s) & material(s) (a name or a list of names),
+    and the rows of the years from years[0] up to & including years[1].
+    """
+    import pyarrow.dataset
+    with open(os.path.join(Folder, '_dataset.json')) as File:
+        Layout = json.load(File)
+    Format = Format or Layout['format']
+    Dataset = pyarrow.dataset.dataset(Folder, format='ipc' if Format == 'feather' else Format, partitioning=pyarrow.dataset.HivePartitioning.discover(infer_dictionary=True))   # flow & material as categorical columns
+    Filter = None
+    def add(Condition):
+        return Condition if Filter is None else Filter & Condition
+    for Name, Value in [('flow', flow), ('material', material)]:
+        if Value is not None:
+            Filter = add(pyarrow.dataset.field(Name).isin(list(np.atleast_1d(Value))))
+    if years is not None:
+        Filter = add((pyarrow.dataset.field('year') >= years[0]) & (pyarrow.dataset.field('year') <= years[1]))
+    return Dataset.to_table(filter=Filter).to_pandas()
+
+
+# The end.
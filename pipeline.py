@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Staged pipeline for BUMA
+
+The model runs as a chain of stages (inputs -> demand curves -> historic tail -> floorspace -> stock model -> material -> output).
+The result of each stage is stored on disk, under a hash (key) of everything the stage depends on:
+    - the name of the stage & the keys of the stages it uses, so that a change upstream invalidates all stages downstream
+    - the content of the input files it reads
+    - the settings (flags & constants) it uses
+    - the code of the stage function & the source files of the modules it calls
+A rerun only recomputes the stages of which the key has changed, the others are loaded from disk (and only when a later stage needs them).
+E.g. switching the material intensity variant (flag_Mean) only reruns the material & output stages, not the stock model.
+With a Monitor (instrumentation.RunMonitor), the time, memory & result sizes of each stage that is computed or loaded are recorded.
+
+Within the stock model stage, the state of the recursion can be kept at checkpoint years (CheckpointStore), so that a stage that is invalidated
+by a change of the stock after such a year (e.g. another future scenario, or a later end year) resumes from the latest checkpoint before the change.
+
+dependencies:
+    numpy >= 1.9
+"""
+
+import os
+import types
+import pickle
+import inspect
+import hashlib
+import contextlib
+import numpy as np
+
+
+def value_hash(Hash, Value):
+    """ Add a setting to Hash: arrays by their content, anything else by its repr (numbers, strings, lists, ...). """
+    if isinstance(Value, np.ndarray):
+        Hash.update(repr((Value.dtype.str, Value.shape)).encode())
+        Hash.update(np.ascontiguousarray(Value).tobytes())
+    else:
+        Hash.update(repr(Value).encode())
+
+
+def code_hash(Hash, Code):
+    """ Add the byte code, constants & names of a function (including nested functions) to Hash, but not its line numbers. """
+    Hash.update(Code.co_code)
+    Hash.update(repr(Code.co_names).encode())
+    for Constant in Code.co_consts:
+        if isinstance(Constant, types.CodeType):
+            code_hash(Hash, Constant)
+        else:
+            Hash.update(repr(Constant).encode())
+
+
+class StageCache(object):
+
+    """ Runs the stages of the model and keeps their results on disk in CacheDir, keyed by the hash of their inputs.
+
+    Set Enabled to False to compute all stages (nothing is read from or written to disk).
+    Set DryRun to True to only determine the keys of the stages, without computing or loading anything.
+    After a run, Keys holds the key of each stage, Computed & Loaded the names of the stages that were computed or found on disk.
+    Monitor is an optional instrumentation.RunMonitor, that records each stage that is computed (or loaded from disk).
+    """
+
+    def __init__(self, CacheDir = 'cache', Enabled = True, DryRun = False, Monitor = None):
+        self.CacheDir = CacheDir
+        self.Enabled  = Enabled
+        self.DryRun   = DryRun
+        self.Monitor  = Monitor
+        self.Keys     = {}
+        self.Files    = {} # cache file by stage
+        self.Results  = {} # results in memory by stage
+        self.Computed = []
+        self.Loaded   = []
+
+    def key(self, Name, Function, Depends = (), Files = (), Modules = (), Settings = None):
+        """ Key (sha256 hex digest) of stage Name, see the module description for what is included. """
+        Hash = hashlib.sha256()
+        Hash.update(Name.encode())
+        for Stage in Depends:
+            Hash.update(self.Keys[Stage].encode())
+        for FileName in Files:
+            with open(FileName, 'rb') as File:
+                Hash.update(File.read())
+        for ThisKey in sorted((Settings or {}).keys()):
+            Hash.update(ThisKey.encode())
+            value_hash(Hash, Settings[ThisKey])
+        code_hash(Hash, Function.__code__)
+        for Module in Modules:
+            with open(inspect.getsourcefile(Module), 'rb') as File:
+                Hash.update(File.read())
+        return Hash.hexdigest()
+
+    def run(self, Name, Function, Depends = (), Files = (), Modules = (), Store = True, **Settings):
+        """
+        Result of Function(*[results of the Depends stages], **Settings) as stage Name, from disk if the key is unchanged.
+        Files are the input files read by Function, Modules the (own) modules it calls.
+        Store = False keeps the result in memory only, e.g. for very large results that are quicker to compute than to load.
+        """
+        Key = self.key(Name, Function, Depends, Files, Modules, Settings)
+        self.Keys[Name] = Key
+        self.Results.pop(Name, None)
+        if self.DryRun is True:
+            return Name
+        CacheFile = os.path.join(self.CacheDir, 'stage_' + Name + '_' + Key[0:16] + '.pkl')
+        if self.Enabled and Store and os.path.isfile(CacheFile):
+            self.Files[Name] = CacheFile
+            self.Loaded.append(Name)
+            return Name
+
+        Arguments = [self.result(Stage) for Stage in Depends]
+        with self.measure(Name, 'stage') as Record:
+            Result = Function(*Arguments, **Settings)
+            if self.Monitor is not None:
+                self.Monitor.sizes(Record, Result)
+        self.Results[Name] = Result
+        self.Computed.append(Name)
+        if self.Enabled and Store:
+            os.makedirs(self.CacheDir, exist_ok=True)
+            TempFile = CacheFile + '.' + str(os.getpid()) + '.tmp'
+            with open(TempFile, 'wb') as File:
+                pickle.dump(Result, File, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(TempFile, CacheFile) # no partially written cache files, e.g. with several runs at once
+            self.Files[Name] = CacheFile
+        return Name
+
+    def add(self, Name, Key, Result):
+        """ Use Result (with its Key) as stage Name, e.g. a stage that was run once by the caller for several runs of the model. """
+        self.Keys[Name]    = Key
+        self.Results[Name] = Result
+        self.Loaded.append(Name)
+        return Name
+
+    def result(self, Name):
+        """ Result of stage Name, loaded from disk on first use. """
+        if Name not in self.Results:
+            with self.measure(Name, 'load') as Record:
+                with open(self.Files[Name], 'rb') as File:
+                    self.Results[Name] = pickle.load(File)
+                if self.Monitor is not None:
+                    self.Monitor.sizes(Record, self.Results[Name])
+        return self.Results[Name]
+
+    def measure(self, Name, Kind):
+        """ Record of the Monitor for stage Name, or nothing without a Monitor. """
+        if self.Monitor is None:
+            return contextlib.nullcontext()
+        return self.Monitor.measure(Name, Kind)
+
+
+class CheckpointStore(object):
+
+    """ States of the recursion of the stock model (compute_stock_driven_model_batch) at the end of checkpoint Years (indices of the time axis), in CacheDir.
+
+    A state is stored under a hash of the stock up to its year & of everything else the recursion depends on (the Context: lifetimes & settings,
+    and the source files of the Modules), so the states of a run are only used by runs with the same stock up to that year.
+    Set Enabled to False to neither use nor keep any states.
+    """
+
+    def __init__(self, CacheDir = 'cache', Years = (), Modules = (), Enabled = True):
+        self.CacheDir = CacheDir
+        self.Years    = sorted(Years)
+        self.Modules  = Modules
+        self.Enabled  = Enabled and len(self.Years) > 0
+        self.Resumed  = None # year of the state the last run resumed from, if any
+
+    def key(self, Year, Stock, Context):
+        """ Key (sha256 hex digest) of the state at the end of Year, for the stock by series Stock[n,t] & the Context (dictionary of settings). """
+        Hash = hashlib.sha256()
+        Hash.update(repr(Year).encode())
+        value_hash(Hash, np.asarray(Stock, dtype=float)[:,0:Year+1])
+        for ThisKey in sorted(Context.keys()):
+            Hash.update(ThisKey.encode())
+            value_hash(Hash, Context[ThisKey])
+        for Module in self.Modules:
+            with open(inspect.getsourcefile(Module), 'rb') as File:
+                Hash.update(File.read())
+        return Hash.hexdigest()
+
+    def file(self, Year, Stock, Context):
+        return os.path.join(self.CacheDir, 'checkpoint_' + str(Year) + '_' + self.key(Year, Stock, Context)[0:16] + '.pkl')
+
+    def latest(self, Stock, Context):
+        """ The state of the latest checkpoint year (before the last year of Stock) that is on disk for this stock & context, or None. """
+        self.Resumed = None
+        if self.Enabled is not True:
+            return None
+        for Year in reversed(self.Years):
+            if Year < np.shape(Stock)[1] - 1 and os.path.isfile(self.file(Year, Stock, Context)):
+                with open(self.file(Year, Stock, Context), 'rb') as File:
+                    State = pickle.load(File)
+                self.Resumed = Year
+                return State
+        return None
+
+    def save(self, States, Stock, Context):
+        """ Keep the States (dictionary of year: state, as returned by compute_stock_driven_model_batch) that are not on disk yet. """
+        if self.Enabled is not True:
+            return
+        os.makedirs(self.CacheDir, exist_ok=True)
+        for Year, State in States.items():
+            FileName = self.file(Year, Stock, Context)
+            if not os.path.isfile(FileName):
+                TempFile = FileName + '.' + str(os.getpid()) + '.tmp'
+                with open(TempFile, 'wb') as File:
+                    pickle.dump(State, File, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(TempFile, FileName)
+
+
+# The end.
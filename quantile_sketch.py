@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming quantiles for BUMA
+
+Percentiles of model results over many runs (e.g. Monte Carlo draws), without keeping the results of all runs.
+Each cell of the results (e.g. flow x region x material x year) gets its own P-square quantile estimator
+(Jain & Chlamtac 1985, with the extension to several quantiles by Raatikainen 1987): a fixed number of markers (2 * quantiles + 3)
+of which the heights are adjusted with a piecewise-parabolic prediction as the observations come in.
+All cells are updated at once with array operations, so the memory use is fixed (a few arrays of the size of the results x markers),
+whatever the number of runs. The mean & standard deviation are kept as well (Welford's algorithm).
+Up to the number of markers, the quantiles are exact (from the stored observations).
+
+Array layout:
+    x[...]                   one observation for all cells (the shape of the results)
+    quantiles()[q,...]       estimated quantile q for all cells
+
+dependencies:
+    numpy >= 1.9
+"""
+
+import numpy as np
+
+
+class StreamingQuantiles(object):
+
+    """ P-square estimates of the Quantiles (e.g. [0.05, 0.5, 0.95]) of each cell of a stream of arrays of the given Shape. """
+
+    def __init__(self, Shape, Quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)):
+        self.Shape     = tuple(Shape)
+        self.Quantiles = np.sort(np.asarray(Quantiles, dtype=float))
+        # marker probabilities: 0, q1/2, q1, (q1+q2)/2, q2, ..., qQ, (qQ+1)/2, 1
+        Edges = np.concatenate(([0.0], self.Quantiles, [1.0]))
+        self.Probabilities = np.concatenate((np.ravel(np.column_stack((Edges[0:-1], (Edges[0:-1] + Edges[1:]) / 2))), [1.0]))
+        self.Nm      = len(self.Probabilities)  # No of markers
+        self.Count   = 0
+        Cells = int(np.prod(self.Shape))
+        # markers x cells, so that each marker is a contiguous array
+        self.Heights   = np.zeros((self.Nm, Cells))
+        self.Positions = np.tile(np.arange(0, self.Nm, dtype=float)[:,np.newaxis], (1, Cells))
+        self.Desired   = self.Probabilities * (self.Nm - 1)
+        self.Mean = np.zeros(Cells)
+        self.M2   = np.zeros(Cells)
+
+    def add(self, x):
+        """ Add one observation x (of the given Shape) to all cells. """
+        x = np.asarray(x, dtype=float).reshape(-1)
+        self.Count += 1
+        Delta = x - self.Mean
+        self.Mean += Delta / self.Count
+        self.M2   += Delta * (x - self.Mean)
+
+        if self.Count <= self.Nm: # the first observations are stored (& sorted) as the initial marker heights
+            self.Heights[self.Count - 1] = x
+            if self.Count == self.Nm:
+                self.Heights.sort(axis=0)
+            return
+
+        H, N = self.Heights, self.Positions
+        # 1) extend the minimum & maximum, & shift the positions of the markers above the observation
+        np.minimum(H[0], x, out=H[0])
+        np.maximum(H[-1], x, out=H[-1])
+        N[1:] += H[1:] > x[np.newaxis,:]
+        N[-1] += H[-1] == x # the maximum itself is always shifted
+        self.Desired = self.Desired + self.Probabilities
+        # 2) move the middle markers that are off their desired position by one or more, with the parabolic (or else linear) prediction
+        for j in range(1, self.Nm - 1):
+            d = self.Desired[j] - N[j]
+            s = np.where((d >= 1) & (N[j+1] - N[j] > 1), 1.0, np.where((d <= -1) & (N[j-1] - N[j] < -1), -1.0, 0.0))
+            if not s.any():
+                continue
+            Hm, Hj, Hp = H[j-1], H[j], H[j+1]
+            Nm, Nj, Np = N[j-1], N[j], N[j+1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                Parabolic = Hj + s / (Np - Nm) * ((Nj - Nm + s) * (Hp - Hj) / (Np - Nj) + (Np - Nj - s) * (Hj - Hm) / (Nj - Nm))
+                Linear    = Hj + s * (np.where(s > 0, Hp, Hm) - Hj) / np.where(s > 0, Np - Nj, Nm - Nj)
+            H[j] = np.where(s == 0, Hj, np.where((Hm < Parabolic) & (Parabolic < Hp), Parabolic, Linear))
+            N[j] = Nj + s
+
+    def quantiles(self):
+        """ Estimated quantiles [q,...] of all cells (exact up to the number of markers). """
+        if self.Count == 0:
+            return np.full((len(self.Quantiles),) + self.Shape, np.nan)
+        if self.Count < self.Nm:
+            Values = np.quantile(self.Heights[0:self.Count], self.Quantiles, axis=0)
+        else:
+            Values = self.Heights[2:self.Nm - 1:2]
+        return Values.reshape((len(self.Quantiles),) + self.Shape)
+
+    def mean(self):
+        return self.Mean.reshape(self.Shape)
+
+    def std(self):
+        """ Sample standard deviation of all cells. """
+        return np.sqrt(self.M2 / max(self.Count - 1, 1)).reshape(self.Shape)
+
+
+# The end.
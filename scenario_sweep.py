@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Scenario sweep for BUMA
+
+Runs the model (building_materials.run_model) for a grid of sensitivity flags, e.g. all 40 combinations of
+flag_alpha (0,1), flag_ExpDec (0,1), flag_Normal (0,1) & flag_Mean (0-4), in a pool of processes (one per cpu by default).
+    - The input csv-files are loaded once (the inputs stage, by flag_alpha) and handed to the workers in shared memory.
+    - The results of each scenario are written to a separate folder (partition) of the output folder, e.g. output/scenarios/alpha0_expdec0_normal0_mean0,
+      with a scenario.json file that holds the settings & the key of the output stage (see pipeline.StageCache).
+    - Scenarios of which the partition already holds the results for the same key (same settings, input files & code) are skipped.
+The stages of the model are cached as usual, so scenarios that only differ in flag_Mean share the stock model results.
+
+Usage (from the model folder):
+    python scenario_sweep.py [--workers N] [--output output/scenarios] [--mean 0 1 2 3 4]
+
+dependencies:
+    numpy >= 1.9
+    pandas
+    python >= 3.8 (multiprocessing.shared_memory)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import concurrent.futures
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+import building_materials
+from pipeline import StageCache
+
+
+def scenario_grid(flag_alpha = (0,1), flag_ExpDec = (0,1), flag_Normal = (0,1), flag_Mean = (0,1,2,3,4)):
+    """
+    All combinations of the given flag values, as a list of settings (keyword arguments of run_model).
+    flag_Mean varies slowest, so that the first scenarios handed to the pool are those with different stock model settings,
+    and the later scenarios (the other intensity variants) find the stock model results in the cache.
+    """
+    return [{'flag_alpha': alpha, 'flag_ExpDec': expdec, 'flag_Normal': normal, 'flag_Mean': mean}
+            for mean, alpha, expdec, normal in itertools.product(flag_Mean, flag_alpha, flag_ExpDec, flag_Normal)]
+
+
+def scenario_name(settings):
+    """ Name of the output partition of a scenario, e.g. alpha0_expdec0_normal0_mean0 """
+    return 'alpha{flag_alpha}_expdec{flag_ExpDec}_normal{flag_Normal}_mean{flag_Mean}'.format(**settings)
+
+
+#%% Shared memory
+
+def share(values):
+    """
+    Copy the arrays & (numeric) dataframes in the dictionary values to shared memory blocks.
+    Returns the blocks (to be unlinked by the caller when the workers are done) & a description to rebuild the dictionary with attach.
+    Other values are passed on as they are (pickled).
+    """
+    blocks, description = [], {}
+    for name, value in values.items():
+        array = value.to_numpy() if isinstance(value, pd.DataFrame) else value
+        if not isinstance(array, np.ndarray) or array.dtype.hasobject:
+            description[name] = ('value', value)
+            continue
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        if isinstance(value, pd.DataFrame):
+            description[name] = ('frame', block.name, array.shape, array.dtype.str, value.index, value.columns)
+        else:
+            description[name] = ('array', block.name, array.shape, array.dtype.str)
+    return blocks, description
+
+
+_attached = [] # shared memory blocks in use by this (worker) process
+
+def attach(description):
+    """ Rebuild the dictionary of share from the shared memory blocks (read-only, without copies). """
+    values = {}
+    for name, item in description.items():
+        if item[0] == 'value':
+            values[name] = item[1]
+            continue
+        block = shared_memory.SharedMemory(name=item[1])   # the blocks are unlinked by the process that created them, when the workers are done
+        _attached.append(block)
+        array = np.ndarray(item[2], dtype=np.dtype(item[3]), buffer=block.buf)
+        array.setflags(write=False)
+        values[name] = pd.DataFrame(array, index=item[4], columns=item[5], copy=False) if item[0] == 'frame' else array
+    return values
+
+
+#%% Workers
+
+_inputs = {} # inputs stage by flag_alpha: (key, result), set once for each worker
+
+def init_worker(shared_inputs):
+    for flag_alpha, (key, description) in shared_inputs.items():
+        _inputs[flag_alpha] = (key, attach(description))
+
+
+def write_partition(folder, settings, key, stages):
+    """ Write the csv output of a scenario, the scenario.json file is written last (and atomically) to mark the partition as complete. """
+    os.makedirs(folder, exist_ok=True)
+    stages.result('output')['material_output'].to_csv(os.path.join(folder, 'material_output.csv')) # in kt
+    stages.result('output')['sqmeters_output'].to_csv(os.path.join(folder, 'sqmeters_output.csv')) # in m2
+    with open(os.path.join(folder, 'scenario.json.tmp'), 'w') as file:
+        json.dump({'settings': settings, 'key': key}, file, indent=1)
+    os.replace(os.path.join(folder, 'scenario.json.tmp'), os.path.join(folder, 'scenario.json'))
+
+
+def run_scenario(settings, folder, cache_dir):
+    """ Run one scenario in a worker & write its partition. Returns the name, the computed stages & the runtime (s). """
+    start = time.time()
+    stages = building_materials.run_model(cache_dir = cache_dir, inputs = _inputs.get(settings['flag_alpha']), output_format = 'csv', **settings)
+    write_partition(folder, settings, stages.Keys['output'], stages)
+    return scenario_name(settings), stages.Computed, time.time() - start
+
+
+#%% Sweep
+
+def completed_key(folder):
+    """ Key of the output stage of the results in a partition, or None if there are no (complete) results. """
+    try:
+        with open(os.path.join(folder, 'scenario.json')) as file:
+            return json.load(file)['key']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def run_sweep(grid, output_dir = os.path.join('output', 'scenarios'), workers = None, cache_dir = building_materials.cache_dir, **fixed):
+    """
+    Run all scenarios of the grid (a list of settings, see scenario_grid) that are not up to date in output_dir.
+    fixed are settings of run_model that are the same for all scenarios (e.g. end_year).
+    workers is the size of the process pool (default: the number of cpu's).
+    Returns a dictionary with the status by scenario name: 'skipped', 'done' or the error message.
+    """
+    status, todo = {}, []
+    for settings in grid:
+        settings = dict(settings, **fixed)
+        folder = os.path.join(output_dir, scenario_name(settings))
+        try:
+            # only the keys of the stages are determined here, nothing is computed yet
+            key = building_materials.run_model(cache_dir = cache_dir, dry_run = True, output_format = 'csv', **settings).Keys['output']
+        except OSError as error:   # e.g. a missing intensity file
+            status[scenario_name(settings)] = str(error)
+            continue
+        if completed_key(folder) == key:
+            status[scenario_name(settings)] = 'skipped'
+        else:
+            todo.append((settings, folder))
+    if len(todo) == 0:
+        return status
+
+    # the inputs stage is run once for each flag_alpha that is needed, & shared with all workers
+    blocks, shared_inputs = [], {}
+    try:
+        for flag_alpha in sorted(set(settings['flag_alpha'] for settings, folder in todo)):
+            end_year = fixed.get('end_year', building_materials.end_year)
+            stages = StageCache(cache_dir if cache_dir is not None else 'cache', Enabled = cache_dir is not None)
+            building_materials.run_inputs(stages, end_year, flag_alpha)
+            new_blocks, description = share(stages.result('inputs'))
+            blocks.extend(new_blocks)
+            shared_inputs[flag_alpha] = (stages.Keys['inputs'], description)
+
+        workers = min(workers or os.cpu_count() or 1, len(todo))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(shared_inputs,)) as pool:
+            futures = {pool.submit(run_scenario, settings, folder, cache_dir): scenario_name(settings) for settings, folder in todo}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    name, computed, seconds = future.result()
+                    status[name] = 'done'
+                    print(name + ': done in ' + str(round(seconds, 1)) + ' s (computed: ' + (', '.join(computed) or '-') + ')')
+                except Exception as error:
+                    status[futures[future]] = repr(error)
+                    print(futures[future] + ': failed, ' + repr(error))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the BUMA model for all combinations of the sensitivity flags.')
+    parser.add_argument('--workers', type=int, default=None, help='size of the process pool (default: number of cpus)')
+    parser.add_argument('--output', default=os.path.join('output', 'scenarios'), help='folder for the output partitions')
+    parser.add_argument('--alpha',  type=int, nargs='+', default=[0,1])
+    parser.add_argument('--expdec', type=int, nargs='+', default=[0,1])
+    parser.add_argument('--normal', type=int, nargs='+', default=[0,1])
+    parser.add_argument('--mean',   type=int, nargs='+', default=[0,1,2,3,4])
+    arguments = parser.parse_args()
+
+    status = run_sweep(scenario_grid(arguments.alpha, arguments.expdec, arguments.normal, arguments.mean), arguments.output, arguments.workers)
+    for name in sorted(status):
+        print(name + ': ' + status[name])
+    sys.exit(0 if all(state in ('done', 'skipped') for state in status.values()) else 1)
+
+
+# The end.
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Global sensitivity analysis for BUMA
+
+Which inputs drive the material demand (inflow) in the last model year (end_year, e.g. 2050), by material & region?
+The inputs are declared as a parameter space (parameter_space: name, lowest & highest value) and varied together:
+    - Morris screening (elementary effects): trajectories through a grid of levels, one parameter changed at a time,
+      giving mu* (mean absolute effect, the importance), mu & sigma (interactions & non-linearity) for each parameter
+    - Sobol indices: Saltelli sample matrices A, B & AB_i (A with column i of B), from a (scrambled) Sobol sequence,
+      giving the first-order (Saltelli 2010) & total (Jansen 1999) indices of each parameter
+Both methods are scaled to the unit hypercube (the parameter ranges).
+
+The model is evaluated in batches: the floorspace stages of building_materials are run for each parameter set,
+and the stock model for all parameter sets, building types & regions of the batch at once (only the floorspace inflow is needed,
+as the material inflow in year t is the floorspace inflow times the intensity of cohort t).
+Batches are run in a pool of processes, e.g. the Sobol indices of 10 parameters with N = 1024 take 12288 evaluations.
+The stock model runs with building_materials.stock_model_kernel (see dsm_kernel). Measured cost of an evaluation (batches of 16 sets, end_year 2050,
+one core): about 0.08 s with the compiled kernel (numba), so 12288 evaluations take about 16 cpu-minutes, and about 0.5 s with the numpy
+stock model (about 1.8 cpu-hours), of which most is the stock model; divide by the number of workers.
+
+Array layout:
+    X[n,p]                   parameter set n, parameter p (in the unit hypercube)
+    Y[n,r,k]                 material inflow in end_year of parameter set n by region r (the regions of the model, e.g. the 26 IMAGE regions, & the world total) & material k
+    indices[p,r,k]           sensitivity index of parameter p for region r & material k
+
+Usage (from the model folder):
+    python sensitivity.py morris [--trajectories 20] [--levels 4]
+    python sensitivity.py sobol [--samples 1024]
+
+dependencies:
+    numpy >= 1.17
+    pandas
+    scipy >= 1.7 (scipy.stats.qmc)
+"""
+
+import os
+import sys
+import time
+import argparse
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+import building_materials
+from material_engine import compute_floorspace_flows
+
+# parameter space: name, lowest & highest value (multipliers of the regular values, except for the inflation correction)
+parameter_space = [
+    ('gompertz_a',        0.9, 1.1),    # a (saturation level) of all Gompertz curves (total & commercial types)
+    ('gompertz_b',        0.9, 1.1),    # b of all Gompertz curves
+    ('gompertz_c',        0.9, 1.1),    # c of all Gompertz curves
+    ('lifetime_shape',    0.8, 1.2),    # Weibull shape (or the Mean with flag_Normal = 1), all building types & regions
+    ('lifetime_scale',    0.8, 1.2),    # Weibull scale (or the StdDev with flag_Normal = 1), all building types & regions
+    ('inflation',         1.1, 1.4),    # gdp/cap inflation correction between 2005 & 2016 (regular value: 1.2423)
+    ('trend_residential', 0.5, 1.5),    # historic trend of the residential floorspace/cap (% decrease per annum)
+    ('trend_commercial',  0.5, 1.5),    # historic trend of the commercial floorspace/cap
+    ('trend_rurpop',      0.5, 1.5),    # historic trend of the rural population share (by region)
+    ('housing_dense',     0.8, 1.2),    # share of the people living in appartments & high-rise (the shares are normalized afterwards)
+]
+
+
+#%% The model as a function of the parameters
+
+def base_model(end_year = building_materials.end_year, flag_alpha = building_materials.flag_alpha, flag_ExpDec = building_materials.flag_ExpDec,
+               flag_Normal = building_materials.flag_Normal, flag_Mean = building_materials.flag_Mean, cache_dir = building_materials.cache_dir,
+               stock_model_kernel = building_materials.stock_model_kernel):
+    """ The regular inputs (from the stage cache) & settings to evaluate the model for other parameter values. """
+    stages = building_materials.run_model(end_year = end_year, flag_alpha = flag_alpha, flag_ExpDec = flag_ExpDec, flag_Normal = flag_Normal, flag_Mean = flag_Mean, cache_dir = cache_dir)
+    return {'end_year': end_year, 'flag_ExpDec': flag_ExpDec, 'stock_model_kernel': stock_model_kernel, 'regions': stages.result('inputs')['regions'],
+            'inputs': stages.result('inputs'),
+            'lifetime': stages.result('dsm')['lifetime'],
+            'intensity': building_materials.intensity_by_building(end_year, building_materials.intensity_file_addition(flag_Mean), stages.result('inputs')['regions'], cache_dir)[:,:,-1,:]}   # building x region x material, cohort end_year
+
+
+def evaluate(base, values, names = None):
+    """ Material inflow in end_year Y[n,r,k] for the parameter values[n,p] (not scaled, in the order of names, default: that of parameter_space). """
+    names = names or [parameter[0] for parameter in parameter_space]
+    end_year = base['end_year']
+    T, Nr = end_year - 1721 + 1, len(base['regions'])
+    stock, lifetime = [], {name: [] for name in base['lifetime'].keys() if name != 'Type'}
+    for row in np.atleast_2d(values):
+        value = dict(zip(names, row))
+        inputs = dict(base['inputs'])
+        gompertz = inputs['gompertz'].copy()
+        for parameter in ['a', 'b', 'c']:
+            gompertz.loc[parameter] = gompertz.loc[parameter] * value.get('gompertz_' + parameter, 1.0)
+        inputs['gompertz'] = gompertz
+        inputs['sva_pc']   = inputs['sva_pc'] * (value.get('inflation', building_materials.inflation) / building_materials.inflation)
+        housing = inputs['housing_type_array'].copy()   # area x building type x region
+        housing[:,2:4,:] = housing[:,2:4,:] * value.get('housing_dense', 1.0)
+        inputs['housing_type_array'] = housing
+
+        # floorspace stages of the model, for this parameter set
+        demand = building_materials.commercial_demand(inputs, end_year, base['flag_ExpDec'], building_materials.expdec_parameters)
+        tail = building_materials.add_tail(inputs, demand, end_year, building_materials.tail_start, building_materials.ramp_length,
+                                           trend_scale = (value.get('trend_residential', 1.0), value.get('trend_commercial', 1.0), value.get('trend_rurpop', 1.0)))
+        floorspace = building_materials.square_meters(inputs, tail)
+        stock.append(np.concatenate([floorspace['m2_res'].reshape(-1, Nr, T), floorspace['m2_comm']]))
+        for name, multiplier in zip(lifetime.keys(), (value.get('lifetime_shape', 1.0), value.get('lifetime_scale', 1.0))):
+            lifetime[name].append(base['lifetime'][name] * multiplier)
+
+    # the stock model for all parameter sets, building types & regions at once
+    stock = np.stack(stock)     # set x building x region x year
+    S, Nb = stock.shape[0:2]
+    lt = {'Type': base['lifetime']['Type']}
+    for name in lifetime.keys():
+        lt[name] = np.stack(lifetime[name]).reshape(S * Nb, Nr)
+    flows = compute_floorspace_flows(np.arange(0,T,1), stock.reshape(S * Nb, Nr, T), lt, NegativeInflowCorrect = True, NonNegativeOutflow = True,
+                                     Kernel = base['stock_model_kernel'])
+    kg = np.einsum('sbr,brk->srk', flows['m2_i'][:,:,-1].reshape(S, Nb, Nr), base['intensity'])
+    return np.concatenate((kg, kg.sum(axis=1, keepdims=True)), axis=1)      # the regions & the world total
+
+
+_base = {}
+
+def init_worker(settings):
+    _base.update(base_model(**settings))
+
+
+def run_evaluations(values, workers = None, batch = 16, settings = None):
+    """ Y[n,r,k] for all parameter sets values[n,p] (not scaled), in batches of batch sets in a pool of processes. """
+    settings = settings or {}
+    batches = [values[start:start + batch] for start in range(0, len(values), batch)]
+    workers = min(workers or os.cpu_count() or 1, len(batches))
+    start = time.time()
+    if workers == 1:
+        base = base_model(**settings)
+        return np.concatenate([evaluate(base, rows) for rows in batches])
+    base_model(**settings) # fill the stage cache once, before the workers load it
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(settings,)) as pool:
+        results = []
+        for number, result in enumerate(pool.map(run_batch, batches)):
+            results.append(result)
+            print(str(min((number + 1) * batch, len(values))) + ' of ' + str(len(values)) + ' evaluations, ' + str(round(time.time() - start)) + ' s')
+    return np.concatenate(results)
+
+
+def run_batch(values):
+    return evaluate(_base, values)
+
+
+def scale(unit, space = parameter_space):
+    """ Parameter values from the unit hypercube [n,p] to the parameter ranges. """
+    low  = np.array([parameter[1] for parameter in space])
+    high = np.array([parameter[2] for parameter in space])
+    return low + unit * (high - low)
+
+
+#%% Morris screening
+
+def morris_sample(trajectories, k, levels = 4, seed = 0):
+    """
+    Morris trajectories in the unit hypercube: X[t*(k+1)+j,p] is point j of trajectory t. Each trajectory starts at a random point of the grid of levels,
+    & changes one parameter at a time (in random order) by Delta = levels / (2 * (levels - 1)), up or down (to stay within the unit range).
+    """
+    rng = np.random.default_rng(seed)
+    Delta = levels / (2.0 * (levels - 1))
+    X = np.zeros((trajectories, k + 1, k))
+    for t in range(0, trajectories):
+        X[t,0] = rng.integers(0, levels, k) / (levels - 1)
+        for j, p in enumerate(rng.permutation(k)):
+            X[t,j+1] = X[t,j]
+            X[t,j+1,p] = X[t,j,p] + Delta if X[t,j,p] + Delta <= 1 else X[t,j,p] - Delta
+    return X.reshape(-1, k)
+
+
+def morris_indices(X, Y, k):
+    """ mu* (mean absolute elementary effect), mu & sigma [p,...] from the Morris sample X & the results Y [n,...]. """
+    X = X.reshape(-1, k + 1, k)
+    Y = Y.reshape((X.shape[0], k + 1) + Y.shape[1:])
+    Step = np.diff(X, axis=1)                            # trajectory x step x parameter, one nonzero value by step
+    Parameter = np.abs(Step).argmax(axis=2)              # the parameter changed in each step
+    Effect = np.diff(Y, axis=1) / Step.sum(axis=2).reshape(Step.shape[0:2] + (1,) * (Y.ndim - 2))
+    EE = np.zeros((k, X.shape[0]) + Y.shape[2:])         # elementary effects: parameter x trajectory x ...
+    for t in range(0, X.shape[0]):
+        EE[Parameter[t],t] = Effect[t]
+    return {'mu_star': np.abs(EE).mean(axis=1), 'mu': EE.mean(axis=1), 'sigma': EE.std(axis=1, ddof=1) if X.shape[0] > 1 else np.zeros(EE.shape[0:1] + EE.shape[2:])}
+
+
+#%% Sobol indices
+
+def saltelli_sample(samples, k, seed = 0):
+    """
+    Saltelli sample matrices in the unit hypercube, stacked as X = [A; B; AB_1; ...; AB_k] (samples x (k + 2) rows),
+    with A & B from a scrambled Sobol sequence of dimension 2k. The number of samples is rounded up to a power of 2.
+    """
+    m = int(np.ceil(np.log2(max(samples, 2))))
+    AB = qmc.Sobol(d=2 * k, scramble=True, seed=seed).random_base2(m)
+    A, B = AB[:,0:k], AB[:,k:]
+    ABi = np.repeat(A[np.newaxis], k, axis=0)
+    for i in range(0, k):
+        ABi[i,:,i] = B[:,i]
+    return np.concatenate([A, B] + list(ABi))
+
+
+def sobol_indices(Y, k):
+    """ First-order (S1) & total (ST) Sobol indices [p,...] from the results Y [n,...] of the Saltelli sample. """
+    N = Y.shape[0] // (k + 2)
+    fA, fB = Y[0:N], Y[N:2 * N]
+    fABi = Y[2 * N:].reshape((k, N) + Y.shape[1:])
+    Variance = np.concatenate((fA, fB)).var(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S1 = (fB[np.newaxis] * (fABi - fA[np.newaxis])).mean(axis=1) / Variance       # Saltelli et al. (2010)
+        ST = 0.5 * ((fA[np.newaxis] - fABi)**2).mean(axis=1) / Variance              # Jansen (1999)
+    return {'S1': np.where(Variance > 0, S1, 0), 'ST': np.where(Variance > 0, ST, 0)}
+
+
+def index_table(indices, space = parameter_space, regions = None):
+    """ Indices (dictionary of [p,r,k] arrays) as one dataframe: statistic, parameter & material x region (the labels regions, 1 to Nr by default, & World). """
+    names = [parameter[0] for parameter in space]
+    materials = building_materials.material_names
+    tables = []
+    for statistic, values in indices.items():
+        labels = list(range(1, values.shape[1])) if regions is None else list(regions)
+        table = pd.DataFrame(values.transpose(0,2,1).reshape(-1, values.shape[1]), columns=labels + ['World'])
+        table.insert(0,'material',  np.tile(materials, len(names)))
+        table.insert(0,'parameter', np.repeat(names, len(materials)))
+        table.insert(0,'statistic', statistic)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Global sensitivity analysis of the BUMA material demand in the last model year.')
+    parser.add_argument('method', choices=['morris', 'sobol'])
+    parser.add_argument('--trajectories', type=int, default=20, help='Morris: number of trajectories')
+    parser.add_argument('--levels',       type=int, default=4,  help='Morris: number of levels of the grid')
+    parser.add_argument('--samples',      type=int, default=1024, help='Sobol: base samples (N), N * (parameters + 2) evaluations')
+    parser.add_argument('--seed',         type=int, default=0)
+    parser.add_argument('--workers',      type=int, default=None, help='size of the process pool (default: number of cpus)')
+    parser.add_argument('--batch',        type=int, default=16, help='parameter sets by batch (vectorized stock model)')
+    arguments = parser.parse_args()
+
+    k = len(parameter_space)
+    if arguments.method == 'morris':
+        X = morris_sample(arguments.trajectories, k, arguments.levels, arguments.seed)
+        indices = morris_indices(X, run_evaluations(scale(X), arguments.workers, arguments.batch), k)
+    else:
+        X = saltelli_sample(arguments.samples, k, arguments.seed)
+        indices = sobol_indices(run_evaluations(scale(X), arguments.workers, arguments.batch), k)
+    os.makedirs('output', exist_ok=True)
+    regions = [int(region) for region in building_materials.store.read_csv(building_materials.file_pop, index_col = [0]).columns]   # as building_materials.load_inputs
+    index_table(indices, regions = regions).to_csv(os.path.join('output', 'sensitivity_' + arguments.method + '.csv'))
+    sys.exit(0)
+
+
+# The end.
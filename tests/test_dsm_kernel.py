@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Equivalence of the compiled kernel of the batched stock driven model (dsm_kernel) & its numpy path (compute_stock_driven_model_batch).
+
+With numba installed, the compiled kernel is tested (the one that Kernel = 'auto' uses), without numba the same loops run uncompiled.
+
+Usage (from the model folder):
+    python -m pytest tests
+"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import dsm_kernel
+from dynamic_stock_model import compute_stock_driven_model_batch
+
+Nn, Nt = 24, 120 # small, so the loops run in a few seconds without numba as well
+Tolerance = 1e-10 # largest difference, relative to the largest value of a result
+
+
+@pytest.fixture(autouse=True)
+def kernel(monkeypatch):
+    """ The compiled kernel with numba, else the uncompiled loops (as if they were compiled). """
+    if dsm_kernel.kernel() is None:
+        monkeypatch.setattr(dsm_kernel, '_compiled', dsm_kernel.stock_driven_years)
+
+
+def difference(Results, Expected):
+    """ Largest difference of all results (the same tuples), relative to the largest value of each result. """
+    return max(float(np.max(np.abs(A - B))) / max(float(np.max(np.abs(B))), 1e-300) for A, B in zip(Results, Expected))
+
+
+@pytest.mark.parametrize('Nk', [1, 3])
+@pytest.mark.parametrize('Case', ['plain', 'initial stock', 'MaxAge'])
+def test_kernel_equals_numpy(Case, Nk):
+    Stock, lt, Intensity = dsm_kernel.synthetic_series(Nn, Nt, Nk)
+    Options = dsm_kernel.synthetic_cases(Stock, lt)[Case]
+    Results = {Kernel: compute_stock_driven_model_batch(np.arange(0,Nt), Stock, lt, True, True, Intensity = Intensity, ReturnCorrection = True,
+                                                        Kernel = Kernel, **Options) for Kernel in ['numpy', 'jit']}
+    assert np.any(Results['numpy'][3] < 1) # the negative inflow correction is part of the test
+    assert difference(Results['jit'], Results['numpy']) <= Tolerance
+
+
+def test_kernel_resumes_from_checkpoint():
+    Stock, lt, Intensity = dsm_kernel.synthetic_series(Nn, Nt)
+    Years = (Nt // 2, Nt - 10)
+    Full = compute_stock_driven_model_batch(np.arange(0,Nt), Stock, lt, True, True, Intensity = Intensity, ReturnCorrection = True,
+                                            CheckpointYears = Years, Kernel = 'jit')
+    Expected = compute_stock_driven_model_batch(np.arange(0,Nt), Stock, lt, True, True, Intensity = Intensity, ReturnCorrection = True, Kernel = 'numpy')
+    assert difference(Full[0:4], Expected) <= Tolerance
+    for Year in Years:
+        # the checkpoints of both paths hold the same state
+        Checkpoint = compute_stock_driven_model_batch(np.arange(0,Nt), Stock, lt, True, True, Intensity = Intensity, ReturnCorrection = True,
+                                                      CheckpointYears = (Year,), Kernel = 'numpy')[4][Year]
+        assert difference([Full[4][Year][Name] for Name in sorted(Checkpoint.keys()) if Name not in ('Year', 'First')],
+                          [Checkpoint[Name] for Name in sorted(Checkpoint.keys()) if Name not in ('Year', 'First')]) <= Tolerance
+        Resumed = compute_stock_driven_model_batch(np.arange(0,Nt), Stock, lt, True, True, Intensity = Intensity, ReturnCorrection = True,
+                                                   Resume = Full[4][Year], Kernel = 'jit')
+        assert difference(Resumed, Expected) <= Tolerance
+
+
+def test_kernel_without_numba_falls_back(monkeypatch):
+    monkeypatch.setattr(dsm_kernel, '_compiled', None)
+    monkeypatch.setitem(sys.modules, 'numba', None) # import numba fails
+    Stock, lt, Intensity = dsm_kernel.synthetic_series(Nn, Nt)
+    Results = compute_stock_driven_model_batch(np.arange(0,Nt), Stock, lt, True, True, Intensity = Intensity, Kernel = 'auto')
+    Expected = compute_stock_driven_model_batch(np.arange(0,Nt), Stock, lt, True, True, Intensity = Intensity, Kernel = 'numpy')
+    assert all(np.array_equal(A, B) for A, B in zip(Results, Expected)) # the numpy path itself
+    with pytest.raises(ImportError):
+        compute_stock_driven_model_batch(np.arange(0,Nt), Stock, lt, True, True, Intensity = Intensity, Kernel = 'jit')
+
+
+# The end.